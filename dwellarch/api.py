@@ -0,0 +1,121 @@
+"""Helpers shared by the read-only json views in people.views and dwellings.views.
+
+Pages are found with keyset pagination: rather than OFFSET, which reads and
+throws away every row before the page, the client passes back the key of
+the last row it got (?after=id, or ?after=date.id for dated rows) and the
+next page starts right after it using the index, so page 10,000 is as cheap
+as page 1.
+
+Each response carries an ETag built from the ids and row versions (the
+PostgreSQL xmin system column, which changes whenever a row is updated) of
+the rows on the page and the related rows shown with them, so a client
+sending If-None-Match gets a 304 after two small queries. Other databases
+have no row version, and an ETag of ids alone would not change when a row
+is edited, so responses from them carry no ETag. The page itself is
+streamed row by row rather than built in memory."""
+import datetime
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+class BadRequest(Exception):
+    pass
+
+def limit(request):
+    try:
+        size = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return max(1, min(size, MAX_LIMIT))
+
+def cursor(request, dated):
+    """returns the (date, id) or (id,) key given as ?after=, or None"""
+    after = request.GET.get('after')
+    if not after:
+        return None
+    try:
+        if dated:
+            date, row_id = after.split('.')
+            return (datetime.datetime.strptime(date, '%Y-%m-%d').date(),
+                    int(row_id))
+        return (int(after),)
+    except ValueError:
+        raise BadRequest("after must be {}".format(
+            'a date and id like 2012-01-31.123' if dated else 'an id'))
+
+def encode_cursor(key):
+    return '.'.join(k.isoformat() if isinstance(k, datetime.date) else str(k)
+            for k in key)
+
+def keyset(queryset, date_field, after):
+    """orders queryset by (date_field, id), or id if date_field is None,
+    and starts it after the key"""
+    if date_field is None:
+        queryset = queryset.order_by('id')
+        return queryset.filter(id__gt=after[0]) if after else queryset
+    queryset = queryset.order_by(date_field, 'id')
+    if after:
+        date, row_id = after
+        queryset = queryset.filter(Q(**{date_field + '__gt': date}) |
+                Q(**{date_field: date, 'id__gt': row_id}))
+    return queryset
+
+def versions(queryset):
+    """returns a list of (id, row version) of queryset's rows, or None if
+    the database doesn't keep row versions"""
+    if connection.vendor != 'postgresql':
+        return None
+    table = queryset.model._meta.db_table
+    return list(queryset.extra(select={'row_version':
+        '"{}".xmin::text'.format(table)}).values_list('id', 'row_version'))
+
+def etag(*version_lists):
+    digest = hashlib.md5()
+    for version_list in version_lists:
+        digest.update(repr(version_list).encode('utf-8'))
+        digest.update(b'|')
+    return '"{}"'.format(digest.hexdigest())
+
+def page(request, queryset, serialize, date_field=None, related=None):
+    """returns a streamed json response with one page of queryset.
+    serialize(row, context) turns a row into a dictionary. related, if
+    given, is called with the ids on the page and returns (context,
+    querysets whose row versions also go into the ETag)."""
+    try:
+        size, after = limit(request), cursor(request, date_field is not None)
+    except BadRequest as e:
+        return HttpResponseBadRequest(str(e))
+    rows = keyset(queryset, date_field, after)
+    keys = list(rows.values_list(*((date_field, 'id') if date_field else
+        ('id',)))[:size + 1])
+    more = len(keys) > size
+    keys = keys[:size]
+    ids = [key[-1] for key in keys]
+    context, related_querysets = related(ids) if related else ({}, [])
+    tag, page_versions = None, versions(queryset.model.objects.filter(id__in=ids))
+    if page_versions is not None:
+        tag = etag(page_versions, *[versions(q) for q in related_querysets])
+    if tag is not None and request.META.get('HTTP_IF_NONE_MATCH') == tag:
+        response = HttpResponse(status=304)
+    else:
+        response = StreamingHttpResponse(_stream(rows.filter(id__in=ids),
+            serialize, context, encode_cursor(keys[-1]) if more else None),
+            content_type='application/json')
+    if tag is not None:
+        response['ETag'] = tag
+    return response
+
+def _stream(rows, serialize, context, next_cursor):
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    separator = ''
+    for row in rows.iterator():
+        yield separator + encoder.encode(serialize(row, context))
+        separator = ',\n'
+    yield '],\n"next": {}}}\n'.format(json.dumps(next_cursor))
@@ -0,0 +1,180 @@
+"""Opt-in timing of the date-dependent model methods that do the most queries.
+
+Set INSTRUMENTATION = True in settings to wrap the methods in METHODS when
+the url configuration loads. Every call is counted; a fraction of calls
+(INSTRUMENTATION_SAMPLE_RATE) is also timed into a latency histogram and has
+its queries counted, which needs Django's debug cursor for the duration of
+the call, so it is too costly to do for every call under production load.
+
+Each process keeps its own numbers and writes them to a json file in
+INSTRUMENTATION_DIR at most every FLUSH_SECONDS, so the /metrics view and the
+dump_metrics command can report the totals of every worker process in
+Prometheus text format. The files also carry the counters of the name
+classification cache (people.memo.stats()). The files of workers that have
+exited are kept so the counters never go down, but only running workers
+count toward the dwellarch_memo_entries gauge."""
+import errno
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from people import memo
+
+METHODS = (
+        ('dwellings.models', 'Prop', 'owners'),
+        ('dwellings.models', 'Unit', 'managers'),
+        ('dwellings.models', 'Occupant', 'full_address'),
+        ('people.models', 'Person', 'allCurrentNames'),
+        ('people.models', 'NameChange', 'name_type'),
+)
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+MEMO_COUNTERS = ('hits', 'misses', 'expired', 'evicted', 'invalidated')
+FLUSH_SECONDS = 10
+
+_lock = threading.Lock()
+_stats = {} # method name -> {'calls', 'sampled', 'seconds', 'queries', 'buckets'}
+_last_flush = [0.0]
+
+def sample_rate():
+    return getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.01)
+
+def metrics_dir():
+    return getattr(settings, 'INSTRUMENTATION_DIR',
+            os.path.join(tempfile.gettempdir(), 'dwellarch-metrics'))
+
+def _new_stats():
+    return {'calls': 0, 'sampled': 0, 'seconds': 0.0, 'queries': 0,
+            'buckets': [0] * len(BUCKETS)}
+
+def record(name, seconds=None, queries=None):
+    """counts a call of method name, with its timing if it was sampled"""
+    with _lock:
+        stats = _stats.setdefault(name, _new_stats())
+        stats['calls'] += 1
+        if seconds is not None:
+            stats['sampled'] += 1
+            stats['seconds'] += seconds
+            stats['queries'] += queries
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+        due = time.time() - _last_flush[0] > FLUSH_SECONDS
+    if due:
+        flush()
+
+def instrumented(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if random.random() >= sample_rate():
+            record(name)
+            return method(*args, **kwargs)
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        queries_before = len(connection.queries)
+        start = time.time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = time.time() - start
+            queries = len(connection.queries) - queries_before
+            connection.use_debug_cursor = debug_cursor
+            record(name, seconds, queries)
+    wrapper.uninstrumented = method
+    return wrapper
+
+def install():
+    """wraps every method in METHODS, safe to call more than once"""
+    for module_name, class_name, method_name in METHODS:
+        model = getattr(__import__(module_name, fromlist=[class_name]),
+                class_name)
+        method = getattr(model, method_name)
+        if not hasattr(method, 'uninstrumented'):
+            setattr(model, method_name, instrumented(
+                '{}.{}'.format(class_name, method_name), method))
+
+def flush():
+    """writes this process's numbers where other processes can read them"""
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    memo_stats = memo.stats()
+    with _lock:
+        snapshot = json.dumps({'methods': _stats, 'memo': dict((key,
+            memo_stats[key]) for key in MEMO_COUNTERS + ('entries',))})
+        _last_flush[0] = time.time()
+    path = os.path.join(directory, '{}.json'.format(os.getpid()))
+    with open(path + '.part', 'w') as f:
+        f.write(snapshot)
+    os.rename(path + '.part', path)
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+def collect():
+    """returns the numbers of every process that has written some, added
+    up: (method name -> stats, memo counter -> total). Memo entries are only
+    added up over the processes still running."""
+    totals = {}
+    memo_totals = dict((key, 0) for key in MEMO_COUNTERS + ('entries',))
+    directory = metrics_dir()
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            snapshot = json.load(f)
+        for method, stats in snapshot['methods'].items():
+            total = totals.setdefault(method, _new_stats())
+            for key in ('calls', 'sampled', 'seconds', 'queries'):
+                total[key] += stats[key]
+            total['buckets'] = [a + b for a, b in
+                    zip(total['buckets'], stats['buckets'])]
+        for key in MEMO_COUNTERS:
+            memo_totals[key] += snapshot['memo'][key]
+        if _running(int(name[:-len('.json')])):
+            memo_totals['entries'] += snapshot['memo']['entries']
+    return totals, memo_totals
+
+def prometheus_text(collected=None):
+    totals, memo_totals = collect() if collected is None else collected
+    lines = [
+            '# HELP dwellarch_method_calls_total Calls of instrumented model methods.',
+            '# TYPE dwellarch_method_calls_total counter']
+    for method, stats in sorted(totals.items()):
+        lines.append('dwellarch_method_calls_total{{method="{}"}} {}'.format(
+            method, stats['calls']))
+    lines += ['# HELP dwellarch_method_queries_total Queries issued by sampled calls.',
+            '# TYPE dwellarch_method_queries_total counter']
+    for method, stats in sorted(totals.items()):
+        lines.append('dwellarch_method_queries_total{{method="{}"}} {}'.format(
+            method, stats['queries']))
+    lines += ['# HELP dwellarch_method_seconds Latency of sampled calls.',
+            '# TYPE dwellarch_method_seconds histogram']
+    for method, stats in sorted(totals.items()):
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append('dwellarch_method_seconds_bucket{{method="{}",le="{}"}} {}'
+                    .format(method, bound, count))
+        lines.append('dwellarch_method_seconds_bucket{{method="{}",le="+Inf"}} {}'
+                .format(method, stats['sampled']))
+        lines.append('dwellarch_method_seconds_sum{{method="{}"}} {}'.format(
+            method, stats['seconds']))
+        lines.append('dwellarch_method_seconds_count{{method="{}"}} {}'.format(
+            method, stats['sampled']))
+    lines += ['# HELP dwellarch_memo_total Lookups and invalidations of the name classification cache.',
+            '# TYPE dwellarch_memo_total counter']
+    for key in MEMO_COUNTERS:
+        lines.append('dwellarch_memo_total{{event="{}"}} {}'.format(key,
+            memo_totals[key]))
+    lines += ['# HELP dwellarch_memo_entries Entries in the name classification cache.',
+            '# TYPE dwellarch_memo_entries gauge',
+            'dwellarch_memo_entries {}'.format(memo_totals['entries'])]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from dwellarch import instrument
+
+class Command(BaseCommand):
+    help = 'Prints the instrumented model method metrics written by every \
+            process, in Prometheus text format. See dwellarch/instrument.py'
+
+    def handle(self, *args, **options):
+        self.stdout.write(instrument.prometheus_text())
@@ -118,9 +118,23 @@ INSTALLED_APPS = (
     'django.contrib.admin',
     # Uncomment the next line to enable admin documentation:
     # 'django.contrib.admindocs',
-#    'people'
+    'people',
+    'places',
+    'dwellings',
+    'jobs',
+    'dwellarch',
 )
 
+# Transfers and rates older than dwellings.archive.ARCHIVE_YEARS are moved
+# here by the archive_old_rows command.
+ARCHIVE_DIR = '/home/colin/dwellarch/archive'
+
+# Set to True to count and time the date-dependent model methods listed in
+# dwellarch/instrument.py and serve the numbers at /metrics. Only this
+# fraction of calls is timed and has its queries counted.
+INSTRUMENTATION = False
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.conf.urls import patterns, include, url
 
 # Uncomment the next two lines to enable the admin:
@@ -14,4 +15,18 @@ urlpatterns = patterns('',
 
     # Uncomment the next line to enable the admin:
     # url(r'^admin/', include(admin.site.urls)),
+
+    url(r'^api/people/$', 'people.views.people', name='api-people'),
+    url(r'^api/props/$', 'dwellings.views.props', name='api-props'),
+    url(r'^api/units/$', 'dwellings.views.units', name='api-units'),
+    url(r'^api/units/(?P<unit_id>\d+)/occupancy/$', 'dwellings.views.occupancy',
+        name='api-unit-occupancy'),
+    url(r'^api/occupancy/$', 'dwellings.views.occupancy', name='api-occupancy'),
 )
+
+if getattr(settings, 'INSTRUMENTATION', False):
+    from dwellarch import instrument
+    instrument.install()
+    urlpatterns += patterns('',
+        url(r'^metrics$', 'dwellarch.views.metrics', name='metrics'),
+    )
@@ -0,0 +1,8 @@
+from django.http import HttpResponse
+from dwellarch import instrument
+
+def metrics(request):
+    """Prometheus text exposition of the instrumented model methods"""
+    instrument.flush()
+    return HttpResponse(instrument.prometheus_text(),
+            content_type='text/plain; version=0.0.4')
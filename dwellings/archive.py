@@ -0,0 +1,243 @@
+"""Cold storage for transfers and rates more than ARCHIVE_YEARS old.
+
+archive() moves old rows out of the database into one directory per table
+under settings.ARCHIVE_DIR, holding one .npy file per column, sorted by date.
+Dates are stored as day ordinals, foreign keys as ids, amounts as integer
+cents and text as fixed-width strings, so the files can be memory-mapped and
+a date range found by binary search without reading the rest.
+
+rows() and values() read the archive back as unsaved model instances or
+tuples, and history(), combined() and latest_group() put archived and live
+rows together, so as-of lookups such as Prop.owners() and the occupancy
+readers (vacancy, screening, households, rentroll) keep working for dates
+that have been archived. The read-only json API pages through live rows
+only."""
+import datetime
+import heapq
+import os
+import shutil
+from decimal import Decimal
+import numpy
+from django.conf import settings
+from django.db import models, transaction
+from dwellings.models import (PropTransfers, OccupantTransfers, ShareTransfer,
+        UnitRate, UnitManageRate, SubletRate, PayRate)
+
+ARCHIVE_YEARS = 10
+BATCH_SIZE = 10000
+MODELS = (PropTransfers, OccupantTransfers, ShareTransfer, UnitRate,
+        UnitManageRate, SubletRate, PayRate)
+NULL = -1 # stored for a missing foreign key, integer or boolean
+NULL_DATE = 0 # ordinals start at 1
+
+_loaded = {} # table -> (mtime, {column: memory-mapped array})
+
+def archive_dir():
+    return getattr(settings, 'ARCHIVE_DIR', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive'))
+
+def date_field(model):
+    return 'transfer_date' if model is ShareTransfer else 'date'
+
+def _table_dir(model):
+    return os.path.join(archive_dir(), model._meta.db_table)
+
+def _columns(model):
+    """returns a list of (field, column name, numpy dtype)"""
+    columns = []
+    for field in model._meta.fields:
+        if isinstance(field, models.DateField):
+            dtype = numpy.int32
+        elif isinstance(field, (models.BooleanField, models.NullBooleanField)):
+            dtype = numpy.int8
+        elif isinstance(field, (models.ForeignKey, models.AutoField,
+            models.IntegerField, models.DecimalField)):
+            dtype = numpy.int64
+        else:
+            dtype = 'U{}'.format(field.max_length or 255)
+        columns.append((field, field.attname, dtype))
+    return columns
+
+def _to_column(field, value):
+    if value is None:
+        return (NULL_DATE if isinstance(field, models.DateField) else
+                NULL if not isinstance(field, (models.CharField,
+                    models.TextField)) else '')
+    if isinstance(field, models.DateField):
+        return value.toordinal()
+    if isinstance(field, models.DecimalField):
+        return int(value.scaleb(field.decimal_places))
+    if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+        return int(value)
+    return value
+
+def _from_column(field, value):
+    if isinstance(field, models.DateField):
+        return (None if value == NULL_DATE else
+                datetime.date.fromordinal(int(value)))
+    if isinstance(field, models.DecimalField):
+        return Decimal(int(value)).scaleb(-field.decimal_places)
+    if isinstance(field, (models.CharField, models.TextField)):
+        return str(value)
+    if value == NULL and (field.null or isinstance(field, models.ForeignKey)):
+        return None
+    if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+        return bool(value)
+    return int(value)
+
+def load(model):
+    """returns {column: array} of the archived rows, memory-mapped, or None
+    if nothing of this table has been archived"""
+    directory = _table_dir(model)
+    if not os.path.isdir(directory):
+        return None
+    mtime = os.path.getmtime(directory)
+    cached = _loaded.get(model._meta.db_table)
+    if cached is None or cached[0] != mtime:
+        arrays = dict((column, numpy.load(os.path.join(directory,
+            column + '.npy'), mmap_mode='r'))
+            for field, column, dtype in _columns(model))
+        cached = _loaded[model._meta.db_table] = (mtime, arrays)
+    return cached[1]
+
+def _write(model, arrays):
+    """replaces a table's archive with arrays, sorted by date then id"""
+    order = numpy.lexsort((arrays['id'], arrays[date_field(model)]))
+    directory = _table_dir(model)
+    new, old = directory + '.new', directory + '.old'
+    shutil.rmtree(new, ignore_errors=True)
+    os.makedirs(new)
+    for column, array in arrays.items():
+        numpy.save(os.path.join(new, column + '.npy'), array[order])
+    if os.path.isdir(directory):
+        os.rename(directory, old)
+    os.rename(new, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    _loaded.pop(model._meta.db_table, None)
+
+def archive(model, before=None):
+    """moves every row of model dated before `before` (defaults to
+    ARCHIVE_YEARS ago) into the archive, returns the number of rows moved.
+    The rows are read BATCH_SIZE at a time but the files are written once,
+    and only then are the rows deleted, a batch per transaction. Rows already
+    in the archive are not written twice, so a run that died after writing
+    the files but before deleting the rows can be repeated."""
+    if before is None:
+        today = datetime.date.today()
+        before = today.replace(year=today.year - ARCHIVE_YEARS, day=min(today.day, 28))
+    columns = _columns(model)
+    existing = load(model)
+    archived = set(existing['id'].tolist()) if existing is not None else set()
+    queryset = model.objects.filter(**{date_field(model) + '__lt': before}
+            ).order_by('id')
+    ids, parts, last = [], [], 0
+    while True:
+        batch = list(queryset.filter(id__gt=last)[:BATCH_SIZE])
+        if not batch:
+            break
+        last = batch[-1].id
+        ids += [row.id for row in batch]
+        new_rows = [row for row in batch if row.id not in archived]
+        if new_rows:
+            parts.append(dict((column, numpy.array([_to_column(field,
+                getattr(row, column)) for row in new_rows], dtype=dtype))
+                for field, column, dtype in columns))
+    if parts:
+        if existing is not None:
+            parts.insert(0, existing)
+        _write(model, dict((column, numpy.concatenate([part[column]
+            for part in parts])) for field, column, dtype in columns))
+    for i in range(0, len(ids), BATCH_SIZE):
+        with transaction.commit_on_success():
+            model.objects.filter(id__in=ids[i:i + BATCH_SIZE]).delete()
+    return len(ids)
+
+def newest(model):
+    """returns the date of the newest archived row of model, or None"""
+    arrays = load(model)
+    dates = arrays[date_field(model)] if arrays is not None else []
+    return datetime.date.fromordinal(int(dates[-1])) if len(dates) else None
+
+def values(model, columns, start=None, end=None, **filters):
+    """returns tuples of columns (attnames such as unit_id) of the archived
+    rows of model dated in [start, end] and matching filters (column=value,
+    e.g. prop_id=3, or column=list of values), oldest first"""
+    arrays = load(model)
+    if arrays is None:
+        return []
+    dates = arrays[date_field(model)]
+    low = 0 if start is None else numpy.searchsorted(dates, start.toordinal())
+    high = (len(dates) if end is None else
+            numpy.searchsorted(dates, end.toordinal(), side='right'))
+    mask = numpy.ones(high - low, dtype=bool)
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            mask &= numpy.in1d(arrays[column][low:high], list(value))
+        else:
+            mask &= arrays[column][low:high] == value
+    indexes = numpy.nonzero(mask)[0] + low
+    fields = dict((column, field) for field, column, dtype in _columns(model))
+    return [tuple(_from_column(fields[column], arrays[column][i])
+        for column in columns) for i in indexes]
+
+def rows(model, start=None, end=None, **filters):
+    """returns the archived rows of model dated in [start, end] and matching
+    filters, as unsaved model instances, oldest first (see values())"""
+    columns = [column for field, column, dtype in _columns(model)]
+    return [model(**dict(zip(columns, row)))
+            for row in values(model, columns, start, end, **filters)]
+
+def combined(model, columns, live, start=None, end=None, **filters):
+    """yields tuples of columns (attnames, including 'id') of the archived
+    rows matching start, end and filters and of the live queryset, sorted by
+    the columns up to id, which must never be None. Live rows that are also
+    archived, left by a run of archive() that stopped before deleting them,
+    are yielded once. The archived rows are read into memory, the live ones
+    are streamed."""
+    archived = sorted(values(model, columns, start, end, **filters))
+    position = columns.index('id')
+    archived_ids = set(row[position] for row in archived)
+    names = dict((field.attname, field.name) for field in model._meta.fields)
+    live = live.order_by(*[names[column] for column in columns[:position + 1]]
+            ).values_list(*[names[column] for column in columns]).iterator()
+    return heapq.merge(archived, (row for row in live
+        if row[position] not in archived_ids))
+
+def history(model, start=None, end=None, **filters):
+    """returns archived and live rows together, newest first like the
+    models' Meta.ordering"""
+    field = date_field(model)
+    live = model.objects.filter(**filters)
+    if start is not None:
+        live = live.filter(**{field + '__gte': start})
+    if end is not None:
+        live = live.filter(**{field + '__lte': end})
+    merged = rows(model, start, end, **filters) + list(live)
+    merged.sort(key=lambda row: (getattr(row, field), row.id), reverse=True)
+    return merged
+
+def latest_group(model, ondate, **filters):
+    """returns the rows sharing the latest date on or before ondate, from
+    the live table or the archive, e.g. the owners of a prop ondate. The
+    archive is only searched when no live row is on or before ondate or the
+    newest archived row isn't older than the live one found, which happens
+    when an old row, such as a historical deed, is added after archiving."""
+    field = date_field(model)
+    live = model.objects.filter(**filters).filter(**{field + '__lte': ondate})
+    live_latest = list(live.order_by('-' + field).values_list(field,
+        flat=True)[:1])
+    archived_newest = newest(model)
+    if live_latest and (archived_newest is None or
+            live_latest[0] > archived_newest):
+        return list(live.filter(**{field: live_latest[0]}))
+    archived = rows(model, None, ondate, **filters)
+    latest = max(live_latest + [getattr(row, field) for row in archived[-1:]]
+            or [None])
+    if latest is None:
+        return []
+    found = [row for row in archived if getattr(row, field) == latest]
+    archived_ids = set(row.id for row in found)
+    if live_latest and live_latest[0] == latest:
+        found += [row for row in live.filter(**{field: latest})
+                if row.id not in archived_ids]
+    return found
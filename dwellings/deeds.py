@@ -0,0 +1,221 @@
+"""Loading property sales from deed feeds in bulk.
+
+Each sale is a row with prop, person, date and price. Rows are grouped into
+deeds and taken in chunks of whole deeds; for each chunk the Occupant and
+Owner of every buyer are found or created with a few set-based queries, the
+whole chunk is checked against the database at once, and the good rows go
+in with one bulk_create inside a single transaction. ingest() reports what
+happened to every row.
+
+Rows for the same prop and date are one deed with several buyers (they
+become co-owners, see Prop.owners). A deed is refused as a conflict if the
+database or the archive already has a different set of transfers for that
+prop on that date, or if its rows disagree on the price. A deed goes in
+whole or not at all: when any of its rows is bad, every row of it is
+refused."""
+import datetime
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from people.models import Person
+from dwellings import archive
+from dwellings.models import Prop, Occupant, Owner, PropTransfers
+
+CHUNK_SIZE = 1000
+COLUMNS = ('prop', 'person', 'date', 'price')
+MAX_PRICE = Decimal(10) ** 12 # PropTransfers.price has 14 digits, 2 decimal
+CENT = Decimal('0.01')
+CREATED, DUPLICATE, ERROR = 'created', 'duplicate', 'error'
+
+def _date(value):
+    return (datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            if isinstance(value, str) else value)
+
+def _parse(row):
+    """returns (prop id, person id, date, price) or raises ValueError"""
+    missing = [column for column in COLUMNS if row.get(column) is None]
+    if missing:
+        raise ValueError('missing {}'.format(', '.join(missing)))
+    try:
+        parsed = (int(row['prop']), int(row['person']), _date(row['date']),
+                Decimal(str(row['price'])))
+    except TypeError as e:
+        raise ValueError(str(e))
+    except InvalidOperation:
+        raise ValueError('bad price {!r}'.format(row['price']))
+    price = parsed[3]
+    if not price.is_finite() or abs(price) >= MAX_PRICE or (
+            price != price.quantize(CENT)):
+        raise ValueError('bad price {!r}'.format(row['price']))
+    return parsed
+
+def _deed(row):
+    """returns the (prop id, date) of a row, or None if they don't parse"""
+    try:
+        return int(row['prop']), _date(row['date'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def resolve_owners(person_ids):
+    """returns a dictionary mapping person id to an Owner id, creating the
+    Occupant and Owner where the person doesn't have one yet"""
+    person_ids = set(person_ids)
+    def occupants():
+        found = {}
+        for occupant_id, person_id in Occupant.objects.filter(
+                person__in=person_ids).order_by('id').values_list(
+                        'id', 'person'):
+            found.setdefault(person_id, occupant_id)
+        return found
+    occupant_ids = occupants()
+    missing = person_ids - set(occupant_ids)
+    if missing:
+        Occupant.objects.bulk_create([Occupant(person_id=person_id)
+            for person_id in missing])
+        occupant_ids = occupants()
+    def owners():
+        found = {}
+        for owner_id, occupant_id in Owner.objects.filter(
+                occupant__in=occupant_ids.values()).order_by('id').values_list(
+                        'id', 'occupant'):
+            found.setdefault(occupant_id, owner_id)
+        return found
+    owner_ids = owners()
+    missing = set(occupant_ids.values()) - set(owner_ids)
+    if missing:
+        Owner.objects.bulk_create([Owner(occupant_id=occupant_id)
+            for occupant_id in missing])
+        owner_ids = owners()
+    return dict((person_id, owner_ids[occupant_id])
+            for person_id, occupant_id in occupant_ids.items())
+
+def validate(parsed):
+    """parsed maps row index to (prop, person, date, price). Returns a
+    dictionary mapping the index of every bad row to a message, and the
+    transfers already recorded for the chunk's deeds, using one query per
+    check for the whole chunk."""
+    prop_ids = set(p[0] for p in parsed.values())
+    props = dict((prop_id, (estate_id, building_id)) for prop_id, estate_id,
+            building_id in Prop.objects.filter(id__in=prop_ids).values_list(
+                'id', 'estate', 'building'))
+    people = set(Person.objects.filter(id__in=set(p[1] for p in
+        parsed.values())).values_list('id', flat=True))
+    deeds = set((p[0], p[2]) for p in parsed.values())
+    existing = {} # (prop, date) -> set of (person, price) already recorded
+    if deeds:
+        for prop_id, date, person_id, price in PropTransfers.objects.filter(
+                prop__in=prop_ids, date__in=set(date for prop, date in deeds)
+                ).values_list('prop', 'date', 'owner__occupant__person',
+                        'price'):
+            if (prop_id, date) in deeds:
+                existing.setdefault((prop_id, date), set()).add(
+                        (person_id, price))
+        dates = [date for prop, date in deeds]
+        archived = [row for row in archive.values(PropTransfers, ('prop_id',
+            'date', 'owner_id', 'price'), min(dates), max(dates),
+            prop_id=prop_ids) if row[:2] in deeds]
+        if archived:
+            people_of = dict(Owner.objects.filter(id__in=set(row[2]
+                for row in archived)).values_list('id', 'occupant__person'))
+            for prop_id, date, owner_id, price in archived:
+                existing.setdefault((prop_id, date), set()).add(
+                        (people_of.get(owner_id), price))
+    return check(parsed, props, people, existing), existing
+
+def check(parsed, props, people, existing):
+    """the checks of validate() on what it loaded: props maps prop id to
+    (estate id, building id), people is the set of person ids that exist and
+    existing is the transfers already recorded by (prop, date). Returns a
+    dictionary mapping the index of every bad row to a message."""
+    errors = {}
+    deeds = {}
+    for i, (prop_id, person_id, date, price) in parsed.items():
+        if prop_id not in props:
+            errors[i] = 'no prop {}'.format(prop_id)
+        elif (props[prop_id][0] is None) == (props[prop_id][1] is None):
+            errors[i] = 'prop {} must have an estate or a building, but not \
+both'.format(prop_id)
+        elif person_id not in people:
+            errors[i] = 'no person {}'.format(person_id)
+        elif price < 0:
+            errors[i] = 'negative price'
+        else:
+            deeds.setdefault((prop_id, date), []).append(i)
+    for rows in deeds.values():
+        if len(set(parsed[i][3] for i in rows)) > 1:
+            for i in rows:
+                errors[i] = 'buyers on the same deed have different prices'
+    for deed, rows in deeds.items():
+        incoming = set((parsed[i][1], parsed[i][3]) for i in rows)
+        if deed in existing and not incoming <= existing[deed]:
+            for i in rows:
+                errors.setdefault(i, 'conflicts with the {} transfers already \
+recorded for prop {} on {}'.format(len(existing[deed]), deed[0], deed[1]))
+    return errors
+
+def reject_deeds(deeds, errors):
+    """deeds maps row index to the row's (prop, date). Adds an error to
+    errors for every row of a deed that has a bad row."""
+    bad = {}
+    for i in sorted(errors):
+        if deeds.get(i) is not None:
+            bad.setdefault(deeds[i], i)
+    for i, deed in deeds.items():
+        if deed in bad and i not in errors:
+            errors[i] = 'row {} of the same deed is bad'.format(bad[deed])
+    return errors
+
+def ingest_chunk(numbered):
+    """loads one chunk of (row number, row) holding whole deeds, returns a
+    list of (row number, status, message)"""
+    parsed = {}
+    deeds = {}
+    errors = {}
+    for i, row in numbered:
+        deeds[i] = _deed(row)
+        try:
+            parsed[i] = _parse(row)
+        except ValueError as e:
+            errors[i] = str(e)
+    found, existing = validate(parsed)
+    errors.update(found)
+    reject_deeds(deeds, errors)
+    report = dict((i, (ERROR, message)) for i, message in errors.items())
+    good = dict((i, p) for i, p in parsed.items() if i not in errors)
+    new = {}
+    for i, (prop_id, person_id, date, price) in sorted(good.items()):
+        if (prop_id, date) in existing:
+            report[i] = (DUPLICATE, 'already recorded')
+        elif (prop_id, person_id, date) in new:
+            report[i] = (DUPLICATE, 'same as row {}'.format(
+                new[(prop_id, person_id, date)]))
+        else:
+            new[(prop_id, person_id, date)] = i
+    with transaction.commit_on_success():
+        owners = resolve_owners(person_id for prop_id, person_id, date in new)
+        PropTransfers.objects.bulk_create([PropTransfers(prop_id=prop_id,
+            owner_id=owners[person_id], date=date, price=good[i][3])
+            for (prop_id, person_id, date), i in sorted(new.items(),
+                key=lambda item: item[1])])
+    for i in new.values():
+        report[i] = (CREATED, '')
+    return [(i,) + report[i] for i in sorted(report)]
+
+def ingest(rows):
+    """loads an iterable of sales (dictionaries with prop, person, date as
+    YYYY-MM-DD and price), returns the report of every row as (row number,
+    status, message). The rows are grouped by deed first and a chunk never
+    splits a deed, so all of a deed's buyers are checked and created
+    together; a deed bigger than CHUNK_SIZE gets a chunk of its own."""
+    deeds = OrderedDict()
+    for i, row in enumerate(rows):
+        deeds.setdefault(_deed(row) or i, []).append((i, row))
+    report, chunk = [], []
+    for numbered in deeds.values():
+        if chunk and len(chunk) + len(numbered) > CHUNK_SIZE:
+            report += ingest_chunk(chunk)
+            chunk = []
+        chunk += numbered
+    if chunk:
+        report += ingest_chunk(chunk)
+    return sorted(report)
@@ -0,0 +1,174 @@
+"""Everything the unit detail screen shows about who lives in a unit.
+
+households() loads the occupants of any number of units on a date, with
+their names, partners, pets (with latest shots and licenses), phones and
+emails in a fixed number of queries, however many units and people there
+are, and returns plain dictionaries and lists ready to be serialized. A
+person's name is their real name on the date, or else their newest current
+name, classified by people.views.name_types as the people api does.
+
+Each table is read once with the date restrictions applied in the query and
+the rows are grouped by hand, which is what Prefetch objects would do on
+newer versions of Django. Occupant transfers that have been archived (see
+dwellings.archive) are included."""
+import datetime
+from collections import namedtuple
+from django.db.models import Q
+from people.models import (NameChange, NameRegistration, Partnership, Pet,
+        Phone, Email)
+from people.views import name_types
+from dwellings import archive
+from dwellings.models import (Unit, Occupant, OccupantTransfers, PetShots,
+        PetLicense)
+from dwellings.rentroll import as_of
+
+Transfer = namedtuple('Transfer', 'date occupant_id eviction_date')
+
+def _group(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(getattr(row, key), []).append(row)
+    return grouped
+
+def current_names(names, agencies):
+    """returns a dictionary mapping person id to their real name, or else
+    their newest current name. names are NameChanges newest first and
+    agencies is as for people.views.name_types"""
+    by_person = {}
+    for name in names:
+        by_person.setdefault(name.person_id, []).append(name)
+    found = {}
+    for person_id, person_names in by_person.items():
+        types = name_types(person_names, agencies)
+        current = [name for name in person_names if name.id in types]
+        real = [name for name in current if types[name.id] == 'real']
+        if real or current:
+            found[person_id] = (real or current)[0].full_name()
+    return found
+
+def _names(person_ids, ondate):
+    """returns a dictionary mapping person id to their name ondate"""
+    agencies = {}
+    for name_change_id, date, agency in NameRegistration.objects.filter(
+            name_change__person__in=person_ids, date__lte=ondate
+            ).values_list('name_change', 'date', 'registered_with'):
+        agencies.setdefault(name_change_id, []).append((date, agency))
+    return current_names(NameChange.objects.filter(person__in=person_ids,
+        date__lte=ondate).order_by('-date', '-id'), agencies)
+
+def _current(queryset, start, end, ondate):
+    """filters queryset to rows started by ondate and not ended by then"""
+    return queryset.filter(Q(**{end + '__isnull': True}) |
+            Q(**{end + '__gt': ondate}), **{start + '__lte': ondate})
+
+def _latest_by(rows, key):
+    """returns the latest row for each value of key, rows oldest first"""
+    latest = {}
+    for row in rows:
+        latest[getattr(row, key)] = row
+    return sorted(latest.values(), key=lambda row: getattr(row, key))
+
+def current_occupants(transfers, ondate):
+    """returns the ids of the occupants living in a unit ondate, given its
+    Transfers sorted by date: those listed by the latest transfer on or
+    before ondate who hadn't been evicted by then"""
+    return [transfer.occupant_id for transfer in as_of(transfers, ondate)
+            if transfer.occupant_id is not None and
+            (transfer.eviction_date is None or
+                transfer.eviction_date > ondate)]
+
+def _address(unit):
+    # no state: Estate.state isn't a database field, and isn't serializable
+    land = unit.prop.land()
+    return {'address': land.address, 'unit': unit.number, 'city': land.city,
+            'zip_code': land.zip_code}
+
+def households(units, ondate=None):
+    """returns a dictionary mapping unit id to the household living there
+    ondate (defaults to today), for units given as instances or ids"""
+    ondate = ondate or datetime.date.today()
+    unit_ids = set(getattr(unit, 'pk', unit) for unit in units)
+    units = Unit.objects.filter(id__in=unit_ids).select_related(
+            'prop__estate', 'prop__building__estate')
+    transfers = {}
+    for unit_id, date, row_id, occupant_id, eviction_date in archive.combined(
+            OccupantTransfers, ('unit_id', 'date', 'id', 'occupant_id',
+                'eviction_date'), OccupantTransfers.objects.filter(
+                    unit__in=unit_ids, date__lte=ondate), None, ondate,
+            unit_id=unit_ids):
+        transfers.setdefault(unit_id, []).append(Transfer(date, occupant_id,
+            eviction_date))
+    occupant_ids = dict((unit_id, current_occupants(unit_transfers, ondate))
+            for unit_id, unit_transfers in transfers.items())
+    found = Occupant.objects.in_bulk([occupant_id for ids in
+        occupant_ids.values() for occupant_id in ids])
+    occupants = dict((unit_id, [found[occupant_id] for occupant_id in ids])
+            for unit_id, ids in occupant_ids.items())
+    person_ids = set(occupant.person_id for unit_occupants in
+            occupants.values() for occupant in unit_occupants)
+
+    partnerships = list(_current(Partnership.objects.filter(
+        Q(person1__in=person_ids) | Q(person2__in=person_ids)),
+        'start_date', 'end_date', ondate))
+    partner_ids = set()
+    for partnership in partnerships:
+        partner_ids.update((partnership.person1_id, partnership.person2_id))
+    names = _names(person_ids | partner_ids, ondate)
+
+    pets = _group(Pet.objects.filter(owner__in=person_ids, date__lte=ondate
+        ).order_by('date', 'id'), 'owner_id')
+    pet_ids = [pet.id for owner_pets in pets.values() for pet in owner_pets]
+    shots = _group(PetShots.objects.filter(pet__in=pet_ids, date__lte=ondate
+        ).order_by('date', 'id'), 'pet_id')
+    licenses = _group(PetLicense.objects.filter(pet__in=pet_ids,
+        date__lte=ondate).order_by('date', 'id'), 'pet_id')
+    phones = _group(_current(Phone.objects.filter(person__in=person_ids),
+        'valid_date', 'invalid_date', ondate).order_by('valid_date', 'id'),
+        'person_id')
+    emails = _group(_current(Email.objects.filter(person__in=person_ids),
+        'date', 'term', ondate).order_by('date', 'id'), 'person_id')
+
+    def partners_of(person_id):
+        partners = []
+        for partnership in partnerships:
+            if partnership.person1_id == person_id:
+                other = partnership.person2_id
+            elif partnership.person2_id == person_id:
+                other = partnership.person1_id
+            else:
+                continue
+            partners.append({'person': other, 'name': names.get(other),
+                'how_related': partnership.get_how_related_display(),
+                'since': partnership.start_date})
+        return partners
+
+    def pet(pet):
+        pet_licenses = licenses.get(pet.id, [])
+        return {'id': pet.id, 'name': pet.name, 'species': pet.species,
+                'shots': [{'shot_name': shot.shot_name, 'date': shot.date,
+                    'expires': shot.expires, 'tag_number': shot.tag_number}
+                    for shot in _latest_by(shots.get(pet.id, []), 'shot_name')],
+                'license': pet_licenses and {
+                    'tag_number': pet_licenses[-1].tag_number,
+                    'date': pet_licenses[-1].date,
+                    'expires': pet_licenses[-1].expires} or None}
+
+    def person(occupant):
+        person_id = occupant.person_id
+        return {'occupant': occupant.id, 'person': person_id,
+                'name': names.get(person_id),
+                'partners': partners_of(person_id),
+                'pets': [pet(p) for p in pets.get(person_id, [])],
+                'phones': [str(phone.phone_number) for phone in
+                    phones.get(person_id, []) if not phone.private],
+                'emails': [email.addr for email in emails.get(person_id, [])]}
+
+    return dict((unit.id, {'unit': unit.id, 'date': ondate,
+        'address': _address(unit),
+        'occupants': [person(occupant) for occupant in
+            occupants.get(unit.id, [])]}) for unit in units)
+
+def household(unit, ondate=None):
+    """returns the household of a single unit, see households()"""
+    unit_id = getattr(unit, 'pk', unit)
+    return households([unit_id], ondate)[unit_id]
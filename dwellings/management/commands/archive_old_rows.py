@@ -0,0 +1,21 @@
+import datetime
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from dwellings import archive
+
+class Command(BaseCommand):
+    help = 'Moves transfers and rates older than {} years out of the database \
+            into the columnar archive in ARCHIVE_DIR'.format(archive.ARCHIVE_YEARS)
+    option_list = BaseCommand.option_list + (
+            make_option('--before', help='Archive rows dated before this \
+                    date (YYYY-MM-DD) instead'),
+    )
+
+    def handle(self, *args, **options):
+        before = None
+        if options['before']:
+            before = datetime.datetime.strptime(options['before'],
+                    '%Y-%m-%d').date()
+        for model in archive.MODELS:
+            self.stdout.write('{}: {} rows archived'.format(
+                model.__name__, archive.archive(model, before)))
@@ -0,0 +1,23 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from dwellings import deeds
+
+class Command(BaseCommand):
+    args = '<sales.csv>'
+    help = 'Loads property sales from a csv file with prop, person, date \
+            (YYYY-MM-DD) and price columns, and prints what happened to \
+            each row. See dwellings/deeds.py'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give one csv file of sales')
+        with open(args[0]) as f:
+            report = deeds.ingest(csv.DictReader(f))
+        counts = {}
+        for row, status, message in report:
+            counts[status] = counts.get(status, 0) + 1
+            if status != deeds.CREATED:
+                self.stdout.write('row {}\t{}\t{}'.format(row + 1, status,
+                    message))
+        self.stdout.write(', '.join('{} {}'.format(count, status)
+            for status, count in sorted(counts.items())))
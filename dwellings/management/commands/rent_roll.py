@@ -0,0 +1,32 @@
+import datetime
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from dwellings import rentroll
+
+class Command(BaseCommand):
+    args = '<directory> <output.csv>'
+    help = 'Generates the rent roll of every prop in parallel. Per-prop files \
+            are kept in directory so an interrupted run picks up where it \
+            left off when run again.'
+    option_list = BaseCommand.option_list + (
+            make_option('--date', help='Report date as YYYY-MM-DD, defaults \
+                    to the first of this month'),
+            make_option('--processes', type='int', default=None,
+                help='Number of worker processes, defaults to one per cpu'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Give a working directory and an output file')
+        directory, output = args
+        ondate = None
+        if options['date']:
+            ondate = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date()
+        def progress(done, total):
+            self.stdout.write('{}/{} props'.format(done, total))
+        try:
+            rentroll.generate(directory, ondate, options['processes'], progress)
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('Merged {} props into {}'.format(
+            rentroll.merge(directory, output), output))
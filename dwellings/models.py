@@ -44,9 +44,8 @@ class Prop(models.Model):
         there should always be at least one owner because if a prop is entered
         without an owner, that form needs to be setup to default to the 'Not
         determined yet' owner"""
-        transfers_beforedate = self.prop_transfers_set.filter(date__lte=ondate)
-        relevant_date = transfers_beforedate.latest().date
-        return list(transfers_beforedate.filter(date=relevant_date))
+        from dwellings import archive # old transfers may have been archived
+        return archive.latest_group(PropTransfers, ondate, prop_id=self.id)
 
 class Occupant(models.Model): # everone in the database is an occupant if have that info
     person = models.ForeignKey(people.Person) # can be a corporation or government agency
@@ -73,8 +72,19 @@ class Occupant(models.Model): # everone in the database is an occupant if have t
     
     def full_address(self):
         """Returns a dictionary of this occupant's personal street address, unit, city, 
-        state, and zip, and comes from the latest OccupantTransfers for this occupant"""
-        return self.occupant_transfers_set.latest().full_address()
+        state, and zip, and comes from the latest OccupantTransfers for this occupant,
+        or None if there are none"""
+        from dwellings import archive # the latest transfer may have been archived
+        latest = None
+        if self.occupant_transfers_set.exists():
+            latest = self.occupant_transfers_set.latest()
+        archived_newest = archive.newest(OccupantTransfers)
+        if archived_newest is not None and (latest is None or
+                latest.date <= archived_newest):
+            archived = archive.rows(OccupantTransfers, occupant_id=self.id)[-1:]
+            if archived and (latest is None or archived[0].date > latest.date):
+                latest = archived[0]
+        return latest.full_address() if latest is not None else None
 
 class Owner(models.Model):
     """The first owner in the database needs to be the first occupant in the database
@@ -214,22 +224,15 @@ class Unit(models.Model):
     def managers(self, ondate=datetime.date.today()):
         """Returns a list of managers for the given ondate, defaults to the 
         landlords if there aren't any managers for this unit."""
-        manager_rates_beforedate = self.unit_manage_rate_set.filter(date__lte=ondate)
-        if bool(manager_rates_beforedate):
-            relevant_date = manager_rates_beforedate.latest().date
-            return list(manager_rates_beforedate.filter(date=relevant_date))
-        else:
-            return self.landlords(ondate)
+        from dwellings import archive # old rates may have been archived
+        return (archive.latest_group(UnitManageRate, ondate, unit_id=self.id) or
+                self.landlords(ondate))
 
     def sublet_lessors(self, ondate=datetime.date.today()):
         """Returns a list of sublet-lessors for ondate. Will be an empty
         list most of the time"""
-        sublet_rates_beforedate = self.sublet_rate_set.filter(date__lte=ondate)
-        if bool(sublet_rates_beforedate):
-            relevant_date = sublet_rates_beforedate.latest().date
-            return list(sublet_rates_beforedate.filter(date=relevant_date))
-        else:
-            return []
+        from dwellings import archive # old rates may have been archived
+        return archive.latest_group(SubletRate, ondate, unit_id=self.id)
 
 class PropTransfers(models.Model):
     owner = models.ForeignKey(Owner)
@@ -249,7 +252,8 @@ class OccupantTransfers(models.Model):
     date = models.DateField('rental date', help_text='If nobody lives here, \
             enter the date that this unit became vacant.')
     eviction_date = models.DateField(help_text='Leave blank until this \
-            occupant is evicted, if ever.', blank=True, null=True, default=None)
+            occupant is evicted, if ever.', blank=True, null=True, default=None,
+            db_index=True)
 
     def full_address(self):
         """Returns a dictionary of street address, unit, city, state, and zip"""
@@ -263,6 +267,7 @@ class OccupantTransfers(models.Model):
     class Meta: 
         get_latest_by = 'date'
         ordering = ['-date'] #lists of occupant transfers are ordered current first 
+        index_together = [['date', 'id'], ['unit', 'date', 'id']] # api keyset pages
 
 class Conviction(models.Model):
     occupant = models.ForeignKey(Occupant) #the person convicted
@@ -275,6 +280,9 @@ class Conviction(models.Model):
     po = models.CharField(help_text='If currently on parole or probation, include \
             P.O. name and phone number.', blank=True, max_length=128)
 
+    class Meta:
+        index_together = [['occupant', 'date']]
+
 class Immunization(models.Model):
     occupant = models.ForeignKey(Occupant)
     doctor = models.ForeignKey(Occupant, blank=True, null=True, default=None)
@@ -0,0 +1,37 @@
+"""Props and units near a point, nearest first. See places.geocoding"""
+from django.db.models import Q
+from places.geocoding import estates_within, estates_in_box
+from dwellings.models import Prop, Unit
+
+def props_within(latitude, longitude, miles):
+    """returns a list of (prop, distance in miles) nearest first"""
+    return _props(estates_within(latitude, longitude, miles))
+
+def props_in_box(south, west, north, east):
+    return _props(estates_in_box(south, west, north, east))
+
+def units_within(latitude, longitude, miles):
+    """returns a list of (unit, distance in miles) nearest first"""
+    return _units(estates_within(latitude, longitude, miles))
+
+def units_in_box(south, west, north, east):
+    return _units(estates_in_box(south, west, north, east))
+
+def _props(estate_distances):
+    distances = dict(estate_distances)
+    props = Prop.objects.filter(Q(estate__in=distances) |
+            Q(building__estate__in=distances)).select_related('building')
+    found = [(prop, distances[prop.estate_id or prop.building.estate_id])
+            for prop in props]
+    found.sort(key=lambda pair: pair[1])
+    return found
+
+def _units(estate_distances):
+    distances = dict(estate_distances)
+    units = Unit.objects.filter(Q(prop__estate__in=distances) |
+            Q(prop__building__estate__in=distances)).select_related(
+                    'prop__building')
+    found = [(unit, distances[unit.prop.estate_id or
+        unit.prop.building.estate_id]) for unit in units]
+    found.sort(key=lambda pair: pair[1])
+    return found
@@ -0,0 +1,154 @@
+"""Monthly rent-roll reports for every Prop, generated by a pool of processes.
+
+Props are split into shards and each shard goes to a worker process with its
+own database connection. A worker loads everything its shard needs (units,
+occupant transfers, unit rates, manager rates and sublet rates, including
+archived ones) with one query per table, then writes one csv file per
+prop. A prop's file is written under a temporary name and renamed when
+complete, so the finished files are the checkpoint: rerunning after a crash
+only generates the missing props. The report date is written to a manifest
+in the directory when a run starts, and a run for a different date refuses
+to resume into it. merge() joins the per-prop files into the final report."""
+import csv
+import datetime
+import multiprocessing
+import os
+from django.db import connections
+from dwellings import archive
+from dwellings.models import (Prop, Unit, OccupantTransfers, UnitRate,
+        UnitManageRate, SubletRate)
+
+SHARD_SIZE = 200
+MANIFEST = 'report-date'
+COLUMNS = ('prop', 'address', 'city', 'zip_code', 'unit', 'occupants',
+        'rent', 'rent_frequency', 'managers', 'management_fees',
+        'sublet_income')
+
+def as_of(rows, ondate):
+    """returns the rows sharing the latest date on or before ondate. rows
+    must be sorted by date, oldest first, like the owners() methods do"""
+    latest, current = None, []
+    for row in rows:
+        if row.date > ondate:
+            break
+        if row.date != latest:
+            latest, current = row.date, []
+        current.append(row)
+    return current
+
+def _by_unit(model, unit_ids, ondate):
+    """the rows of model for unit_ids dated on or before ondate, archived
+    and live, grouped by unit and sorted by date"""
+    archived = archive.rows(model, None, ondate, unit_id=unit_ids)
+    archived_ids = set(row.id for row in archived)
+    rows = archived + [row for row in model.objects.filter(unit__in=unit_ids,
+        date__lte=ondate) if row.id not in archived_ids]
+    grouped = {}
+    for row in sorted(rows, key=lambda row: (row.date, row.id)):
+        grouped.setdefault(row.unit_id, []).append(row)
+    return grouped
+
+def prop_path(directory, prop_id):
+    return os.path.join(directory, 'prop-{}.csv'.format(prop_id))
+
+def _prop_rows(prop, units, transfers, rents, managers, sublets, ondate):
+    land = prop.land()
+    for unit in units:
+        occupants = [transfer.occupant_id for transfer in
+                as_of(transfers.get(unit.id, []), ondate)
+                if transfer.occupant_id is not None and
+                (transfer.eviction_date is None or
+                    transfer.eviction_date > ondate)]
+        rent = as_of(rents.get(unit.id, []), ondate)
+        fees = as_of(managers.get(unit.id, []), ondate)
+        sublet = as_of(sublets.get(unit.id, []), ondate)
+        yield (prop.id, land.address, land.city, land.zip_code, unit.number,
+                ' '.join(str(occupant) for occupant in occupants),
+                sum(rate.amount for rate in rent),
+                ' '.join(rate.frequency for rate in rent),
+                ' '.join(str(rate.manager_id) for rate in fees),
+                sum(rate.amount for rate in fees),
+                sum(rate.amount for rate in sublet))
+
+def _write_shard(job):
+    """worker: writes the report file of every prop in the shard,
+    returns the number of props written"""
+    prop_ids, ondate, directory = job
+    props = Prop.objects.filter(id__in=prop_ids).select_related(
+            'estate', 'building__estate')
+    units = {}
+    for unit in Unit.objects.filter(prop__in=prop_ids).order_by('number'):
+        units.setdefault(unit.prop_id, []).append(unit)
+    unit_ids = [unit.id for prop_units in units.values() for unit in prop_units]
+    transfers = _by_unit(OccupantTransfers, unit_ids, ondate)
+    rents = _by_unit(UnitRate, unit_ids, ondate)
+    managers = _by_unit(UnitManageRate, unit_ids, ondate)
+    sublets = _by_unit(SubletRate, unit_ids, ondate)
+    for prop in props:
+        path = prop_path(directory, prop.id)
+        with open(path + '.part', 'w') as f:
+            csv.writer(f).writerows(_prop_rows(prop, units.get(prop.id, []),
+                transfers, rents, managers, sublets, ondate))
+        os.rename(path + '.part', path)
+    connections['default'].close()
+    return len(prop_ids)
+
+def pending_props(directory):
+    """returns the ids of props without a finished report file, in order"""
+    done = set(name for name in os.listdir(directory) if name.endswith('.csv'))
+    return [prop_id for prop_id in
+            Prop.objects.order_by('id').values_list('id', flat=True)
+            if os.path.basename(prop_path(directory, prop_id)) not in done]
+
+def check_manifest(directory, ondate):
+    """records ondate as the report date of directory, or raises ValueError
+    if the directory holds a report for a different date"""
+    path = os.path.join(directory, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = f.read().strip()
+        if recorded != ondate.isoformat():
+            raise ValueError('{} holds the report for {}, not {}'.format(
+                directory, recorded, ondate.isoformat()))
+    else:
+        with open(path, 'w') as f:
+            f.write(ondate.isoformat() + '\n')
+
+def generate(directory, ondate=None, processes=None, progress=None):
+    """writes a report file for every prop not already done in directory,
+    as of ondate (defaults to the first of this month). progress, if given,
+    is called with (props done, props to do) as shards finish."""
+    ondate = ondate or datetime.date.today().replace(day=1)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    check_manifest(directory, ondate)
+    prop_ids = pending_props(directory)
+    shards = [(prop_ids[i:i + SHARD_SIZE], ondate, directory)
+            for i in range(0, len(prop_ids), SHARD_SIZE)]
+    # children must open their own connections rather than share this one
+    for connection in connections.all():
+        connection.close()
+    pool = multiprocessing.Pool(processes)
+    try:
+        done = 0
+        for count in pool.imap_unordered(_write_shard, shards):
+            done += count
+            if progress is not None:
+                progress(done, len(prop_ids))
+    finally:
+        pool.close()
+        pool.join()
+    return len(prop_ids)
+
+def merge(directory, output):
+    """joins every prop's report file into output, ordered by prop id"""
+    prop_ids = sorted(int(name[len('prop-'):-len('.csv')])
+            for name in os.listdir(directory)
+            if name.startswith('prop-') and name.endswith('.csv'))
+    with open(output, 'w') as out:
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        for prop_id in prop_ids:
+            with open(prop_path(directory, prop_id)) as f:
+                writer.writerows(csv.reader(f))
+    return len(prop_ids)
@@ -0,0 +1,143 @@
+"""Expected payments produced by rates, generated as they are needed.
+
+A rate (UnitRate, UnitManageRate, SubletRate or PayRate) is due every
+period given by its frequency from its start date until a newer rate for the
+same thing takes over: a unit's rent, management or sublet rates are
+replaced by the next rates of that kind for the unit, a PayRate by the next
+one between the same payer and payee. Nothing is stored; each rate becomes
+a generator of Due(date, amount, rate) and the generators for a unit, prop
+or payer are merged into one date-ordered stream with heapq.merge.
+
+Asking for what was due between two dates jumps straight to the first due
+date on or after the start by arithmetic on the frequency, so a range query
+costs the same however old the rates are. Rates that have been moved to the
+archive (see dwellings.archive) are included.
+
+HOURLY rates are paid for hours worked, which the database doesn't record,
+so like NEVER they produce no due dates."""
+import calendar
+import datetime
+import heapq
+from collections import namedtuple
+from dwellings import archive
+from dwellings.models import Unit, UnitRate, UnitManageRate, SubletRate, PayRate
+
+Due = namedtuple('Due', 'date amount rate')
+
+EVERY_DAYS = {'DA': 1, 'WE': 7}
+EVERY_MONTHS = {'MO': 1, '2M': 2, '3M': 3, '6M': 6, 'YE': 12}
+TWICE_A_MONTH = 'TW'
+REPLACED_WITHIN = { # rates are replaced by newer rates with the same values of
+        UnitRate: ('unit_id',),
+        UnitManageRate: ('unit_id',),
+        SubletRate: ('unit_id',),
+        PayRate: ('payer_id', 'payee_id'),
+}
+
+def _month_day(year, month, day):
+    """the date for day of month, or the month's last day if it's shorter"""
+    return datetime.date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+def _add_months(year, month, months):
+    month += months - 1
+    return year + month // 12, month % 12 + 1
+
+def due_dates(start, frequency, since=None):
+    """yields the due dates of a rate starting on start, on or after since,
+    without generating the ones before it"""
+    since = max(start, since or start)
+    if frequency in EVERY_DAYS:
+        step = EVERY_DAYS[frequency]
+        date = start + datetime.timedelta(days=-(-(since - start).days // step) * step)
+        while True:
+            yield date
+            date += datetime.timedelta(days=step)
+    elif frequency in EVERY_MONTHS:
+        step = EVERY_MONTHS[frequency]
+        months = (since.year - start.year) * 12 + since.month - start.month
+        n = months // step
+        while True:
+            date = _month_day(*(_add_months(start.year, start.month, n * step) +
+                (start.day,)))
+            if date >= since:
+                yield date
+            n += 1
+    elif frequency == TWICE_A_MONTH:
+        first = start.day if start.day <= 15 else start.day - 15
+        year, month = since.year, since.month
+        while True:
+            for day in (first, first + 15):
+                date = _month_day(year, month, day)
+                if date >= since:
+                    yield date
+            year, month = _add_months(year, month, 1)
+
+def rate_schedule(rate, until=None, since=None, end=None):
+    """yields Due for rate on or after since and on or before until,
+    stopping before end (the date the rate was replaced)"""
+    for date in due_dates(rate.date, rate.frequency, since):
+        if (end is not None and date >= end) or (until is not None and
+                date > until):
+            return
+        yield Due(date, rate.amount, rate)
+
+def with_ends(rates):
+    """returns (rate, date replaced or None) for rates of one model"""
+    groups = {}
+    for rate in rates:
+        fields = REPLACED_WITHIN[type(rate)]
+        groups.setdefault(tuple(getattr(rate, f) for f in fields), []).append(rate)
+    ended = []
+    for group in groups.values():
+        dates = sorted(set(rate.date for rate in group))
+        following = dict(zip(dates, dates[1:]))
+        ended += [(rate, following.get(rate.date)) for rate in group]
+    return ended
+
+def _tagged(schedule, n):
+    """(date, n, i, Due) for each Due of a schedule, so the heap never gets
+    as far as comparing two rates"""
+    for i, due in enumerate(schedule):
+        yield due.date, n, i, due
+
+def merged(rates_with_ends, since=None, until=None):
+    """yields the Due of every rate in date order with a k-way heap merge"""
+    schedules = [_tagged(rate_schedule(rate, until, since, end), n)
+            for n, (rate, end) in enumerate(rates_with_ends)
+            if end is None or since is None or end > since]
+    return (tagged[-1] for tagged in heapq.merge(*schedules))
+
+def _rates(model, until, live_filters, **archived_filters):
+    live = model.objects.filter(**live_filters)
+    if until is not None:
+        live = live.filter(date__lte=until)
+    return with_ends(archive.rows(model, None, until, **archived_filters) +
+            list(live))
+
+def unit_schedule(units, since=None, until=None):
+    """yields what the rent, management and sublet rates of units (instances
+    or ids) made due between since and until, in date order"""
+    unit_ids = set(getattr(unit, 'pk', unit) for unit in units)
+    rates = []
+    for model in (UnitRate, UnitManageRate, SubletRate):
+        rates += _rates(model, until, {'unit__in': unit_ids}, unit_id=unit_ids)
+    return merged(rates, since, until)
+
+def prop_schedule(prop, since=None, until=None):
+    """unit_schedule() for every unit of a prop"""
+    return unit_schedule(Unit.objects.filter(prop=prop).values_list('id',
+        flat=True), since, until)
+
+def payer_schedule(payer, since=None, until=None):
+    """yields what the PayRates of a payer made due, ending with the
+    payer's end_date if it has one"""
+    if payer.end_date is not None and (until is None or payer.end_date < until):
+        until = payer.end_date - datetime.timedelta(days=1)
+    return merged(_rates(PayRate, until, {'payer': payer.pk},
+        payer_id=payer.pk), since, until)
+
+def total_due(schedule):
+    """returns (list of Due, total amount) for a schedule such as
+    unit_schedule(units, since, until)"""
+    due = list(schedule)
+    return due, sum(d.amount for d in due)
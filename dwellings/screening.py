@@ -0,0 +1,182 @@
+"""Screening rental applicants in batches.
+
+screen() takes the Person ids of a batch of applicants and, in seven
+queries however big the batch is, finds each applicant's convictions and
+evictions and the same for their current partners (Partnership) and the
+people they have lived with: occupants whose tenancy of a unit overlapped
+one of the applicant's. A tenancy runs from an occupant's transfer into a
+unit until the unit's next transfer that doesn't list them, or their
+eviction_date if that comes first. Only convictions and evictions dated on or
+before the screening date count. Convictions are read by occupant and date
+and evictions by eviction_date, both indexed in dwellings.models.
+
+Transfers moved to the archive (see dwellings.archive) are read as well.
+
+screen_batches() screens several batches at once on a pool of threads, each
+using its own database connection."""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.db.models import Q
+from people.models import Partnership
+from dwellings import archive
+from dwellings.models import Occupant, OccupantTransfers, Conviction
+
+BATCH_SIZE = 200
+THREADS = 4
+
+def tenancies(transfers):
+    """transfers are (date, occupant id or None, eviction date or None) for
+    one unit, oldest first; the transfers on a date list everyone living
+    there from then on. Returns a list of (occupant id, start, end or None)."""
+    by_date = []
+    for date, occupant_id, eviction_date in transfers:
+        if not by_date or by_date[-1][0] != date:
+            by_date.append((date, {}))
+        if occupant_id is not None:
+            by_date[-1][1][occupant_id] = eviction_date
+    found = []
+    open_tenancies = {} # occupant id -> index in found of a tenancy ending now
+    for i, (date, occupants) in enumerate(by_date):
+        following = by_date[i + 1][0] if i + 1 < len(by_date) else None
+        still_open = {}
+        for occupant_id, eviction_date in occupants.items():
+            end = following
+            if eviction_date is not None and (end is None or eviction_date < end):
+                end = eviction_date
+            if occupant_id in open_tenancies:
+                n = open_tenancies[occupant_id]
+                found[n] = (occupant_id, found[n][1], end)
+            else:
+                n = len(found)
+                found.append((occupant_id, date, end))
+            if end == following:
+                still_open[occupant_id] = n
+        open_tenancies = still_open
+    return found
+
+def overlapping(unit_tenancies, occupant_ids):
+    """returns a dictionary mapping each of occupant_ids to the other
+    occupants whose tenancies in unit_tenancies overlapped one of theirs"""
+    found = {}
+    for occupant_id, start, end in unit_tenancies:
+        if occupant_id not in occupant_ids:
+            continue
+        for other, other_start, other_end in unit_tenancies:
+            if other != occupant_id and (end is None or other_start < end) and (
+                    other_end is None or start < other_end):
+                found.setdefault(occupant_id, set()).add(other)
+    return found
+
+def _occupants_by_person(person_ids):
+    by_person = {}
+    for occupant_id, person_id in Occupant.objects.filter(
+            person__in=person_ids).values_list('id', 'person'):
+        by_person.setdefault(person_id, set()).add(occupant_id)
+    return by_person
+
+def _record(occupant_ids, convictions, evictions):
+    """the convictions and evictions of one person's occupants"""
+    found = {'convictions': [], 'evictions': []}
+    for occupant_id in occupant_ids:
+        found['convictions'] += convictions.get(occupant_id, [])
+        found['evictions'] += evictions.get(occupant_id, [])
+    found['convictions'].sort(key=lambda c: c['date'], reverse=True)
+    found['evictions'].sort(key=lambda e: e['eviction_date'], reverse=True)
+    found['on_parole_or_probation'] = any(c['po'] for c in found['convictions'])
+    return found
+
+def screen(person_ids, ondate=None):
+    """returns a dictionary mapping each applicant's person id to their
+    screening record: their own convictions and evictions, and those of
+    each partner and each former co-occupant"""
+    ondate = ondate or datetime.date.today()
+    person_ids = set(person_ids)
+    applicant_occupants = _occupants_by_person(person_ids)
+
+    partners = {}
+    for person1, person2 in Partnership.objects.filter(
+            Q(person1__in=person_ids) | Q(person2__in=person_ids),
+            Q(end_date__isnull=True) | Q(end_date__gt=ondate),
+            start_date__lte=ondate).values_list('person1', 'person2'):
+        if person1 in person_ids:
+            partners.setdefault(person1, set()).add(person2)
+        if person2 in person_ids:
+            partners.setdefault(person2, set()).add(person1)
+    partner_occupants = _occupants_by_person(set(partner for found in
+        partners.values() for partner in found) - person_ids)
+    partner_occupants.update(applicant_occupants)
+
+    all_applicant_occupants = set(occupant for found in
+            applicant_occupants.values() for occupant in found)
+    transfers = OccupantTransfers.objects.filter(date__lte=ondate)
+    unit_ids = set(unit_id for occupant_id, row_id, unit_id in
+            archive.combined(OccupantTransfers, ('occupant_id', 'id',
+                'unit_id'), transfers.filter(occupant__in=
+                    all_applicant_occupants), None, ondate,
+                occupant_id=all_applicant_occupants))
+    by_unit = {}
+    for unit_id, date, row_id, occupant_id, eviction_date in archive.combined(
+            OccupantTransfers, ('unit_id', 'date', 'id', 'occupant_id',
+                'eviction_date'), transfers.filter(unit__in=unit_ids), None,
+            ondate, unit_id=unit_ids):
+        by_unit.setdefault(unit_id, []).append((date, occupant_id,
+            eviction_date))
+    co_occupants = {} # applicant occupant id -> occupant ids of roommates
+    for transfers in by_unit.values():
+        for applicant, roommates in overlapping(tenancies(transfers),
+                all_applicant_occupants).items():
+            co_occupants.setdefault(applicant, set()).update(roommates)
+
+    everyone = set(all_applicant_occupants)
+    for found in list(partner_occupants.values()) + list(co_occupants.values()):
+        everyone |= found
+    convictions = {}
+    for conviction in Conviction.objects.filter(occupant__in=everyone,
+            date__lte=ondate).values('occupant', 'date', 'offense', 'county',
+                'doc', 'po'):
+        convictions.setdefault(conviction.pop('occupant'), []).append(conviction)
+    evictions = {}
+    for occupant_id, row_id, unit_id, date, eviction_date in archive.combined(
+            OccupantTransfers, ('occupant_id', 'id', 'unit_id', 'date',
+                'eviction_date'), OccupantTransfers.objects.filter(
+                    occupant__in=everyone, eviction_date__lte=ondate),
+            occupant_id=everyone):
+        if eviction_date is not None and eviction_date <= ondate:
+            evictions.setdefault(occupant_id, []).append({'unit': unit_id,
+                'date': date, 'eviction_date': eviction_date})
+
+    records = {}
+    for person_id in person_ids:
+        own = applicant_occupants.get(person_id, set())
+        record = _record(own, convictions, evictions)
+        record['person'] = person_id
+        record['partners'] = [dict(_record(partner_occupants.get(partner, ()),
+            convictions, evictions), person=partner)
+            for partner in sorted(partners.get(person_id, ()))]
+        record['co_occupants'] = [dict(_record([occupant], convictions,
+            evictions), occupant=occupant) for occupant in sorted(set(
+                roommate for applicant in own
+                for roommate in co_occupants.get(applicant, ())))]
+        records[person_id] = record
+    return records
+
+def _screen_and_close(person_ids, ondate):
+    try:
+        return screen(person_ids, ondate)
+    finally:
+        connection.close() # each thread has its own connection
+
+def screen_batches(person_ids, ondate=None, batch_size=BATCH_SIZE,
+        threads=THREADS):
+    """screens any number of applicants, batch_size at a time on a pool of
+    threads, returns the records of all of them as screen() does"""
+    person_ids = sorted(set(person_ids))
+    batches = [person_ids[i:i + batch_size]
+            for i in range(0, len(person_ids), batch_size)]
+    records = {}
+    with ThreadPoolExecutor(threads) as pool:
+        for batch_records in pool.map(lambda batch: _screen_and_close(batch,
+            ondate), batches):
+            records.update(batch_records)
+    return records
@@ -14,3 +14,188 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class AsOfTest(TestCase):
+    def test_latest_rows_on_or_before_date(self):
+        import datetime
+        from collections import namedtuple
+        from dwellings.rentroll import as_of
+        Row = namedtuple('Row', 'date amount')
+        d = datetime.date
+        rows = [Row(d(2012, 1, 1), 1), Row(d(2012, 6, 1), 2),
+                Row(d(2012, 6, 1), 3), Row(d(2013, 1, 1), 4)]
+        self.assertEqual([row.amount for row in as_of(rows, d(2012, 7, 1))],
+                [2, 3])
+        self.assertEqual(as_of(rows, d(2011, 1, 1)), [])
+
+class HouseholdTest(TestCase):
+    def test_current_occupants_leave_out_the_evicted(self):
+        from datetime import date
+        from dwellings.households import Transfer, current_occupants
+        transfers = [Transfer(date(2012, 1, 1), 1, None),
+                Transfer(date(2012, 6, 1), 2, None),
+                Transfer(date(2012, 6, 1), 3, date(2012, 9, 1)),
+                Transfer(date(2012, 6, 1), None, None),
+                Transfer(date(2013, 1, 1), 4, None)]
+        self.assertEqual(current_occupants(transfers, date(2012, 7, 1)),
+                [2, 3])
+        self.assertEqual(current_occupants(transfers, date(2012, 10, 1)), [2])
+
+    def test_real_name_before_newer_alias(self):
+        from datetime import date
+        from people.models import NameChange, NameRegistration
+        from dwellings.households import current_names
+        class Name(object):
+            def __init__(self, id, person_id, date, method=NameChange.COURT):
+                self.id, self.person_id, self.date = id, person_id, date
+                self.method = method
+            def full_name(self):
+                return 'name {}'.format(self.id)
+        names = [Name(3, 1, date(2012, 1, 1)), Name(2, 2, date(2011, 1, 1)),
+                Name(1, 1, date(2010, 1, 1))] # newest first
+        agencies = {1: [(date(2010, 2, 1), NameRegistration.SSA)]}
+        self.assertEqual(current_names(names, agencies),
+                {1: 'name 1', 2: 'name 2'})
+
+class VacancyTest(TestCase):
+    def test_intervals_and_sweep(self):
+        from datetime import date
+        from dwellings.vacancy import intervals, integrate, _Group
+        transfers = [(date(2012, 1, 1), None, None),
+                (date(2012, 1, 11), 5, date(2012, 1, 21)),
+                (date(2012, 2, 1), 6, None), (date(2012, 2, 1), 7, None)]
+        group = _Group()
+        before = frozenset()
+        for start, end, occupants in intervals(transfers):
+            group.add(start, end, occupants, before)
+            before = occupants or before
+        self.assertEqual(integrate(group.known, date(2012, 1, 1),
+            date(2012, 3, 1), 'month'),
+            [(date(2012, 1, 1), 31), (date(2012, 2, 1), 29)])
+        self.assertEqual(integrate(group.occupied, date(2012, 1, 1),
+            date(2012, 3, 1), 'month'),
+            [(date(2012, 1, 1), 10), (date(2012, 2, 1), 29)])
+        self.assertEqual(sum(group.move_ins.values()), 2)
+        self.assertEqual(group.tenancies, [(date(2012, 1, 21), 10)])
+
+class ScheduleTest(TestCase):
+    def test_due_dates_start_at_since(self):
+        import itertools
+        from datetime import date
+        from dwellings.schedules import due_dates
+        first = lambda *args: list(itertools.islice(due_dates(*args), 3))
+        self.assertEqual(first(date(2012, 1, 31), 'MO'),
+                [date(2012, 1, 31), date(2012, 2, 29), date(2012, 3, 31)])
+        self.assertEqual(first(date(2012, 1, 31), 'MO', date(2012, 5, 1)),
+                [date(2012, 5, 31), date(2012, 6, 30), date(2012, 7, 31)])
+        self.assertEqual(first(date(2012, 1, 20), 'TW', date(2012, 2, 10)),
+                [date(2012, 2, 20), date(2012, 3, 5), date(2012, 3, 20)])
+        self.assertEqual(first(date(2012, 1, 1), 'WE', date(2012, 1, 9)),
+                [date(2012, 1, 15), date(2012, 1, 22), date(2012, 1, 29)])
+        self.assertEqual(first(date(2012, 1, 1), 'NE'), [])
+
+    def test_merge_never_compares_rates(self):
+        from datetime import date
+        from dwellings.schedules import merged
+        class Rate(object): # like a model instance, not orderable
+            frequency, amount = 'MO', 5
+        Rate.date = date(2012, 1, 1)
+        due = list(merged([(Rate(), None), (Rate(), date(2012, 3, 1))],
+            until=date(2012, 4, 1)))
+        self.assertEqual([d.date.month for d in due], [1, 1, 2, 2, 3, 4])
+
+class RentRollManifestTest(TestCase):
+    def test_refuses_to_resume_a_different_date(self):
+        import shutil, tempfile
+        from datetime import date
+        from dwellings.rentroll import check_manifest
+        directory = tempfile.mkdtemp()
+        try:
+            check_manifest(directory, date(2026, 9, 1))
+            check_manifest(directory, date(2026, 9, 1))
+            self.assertRaises(ValueError, check_manifest, directory,
+                    date(2026, 10, 1))
+        finally:
+            shutil.rmtree(directory)
+
+class ArchiveColumnTest(TestCase):
+    def test_values_survive_the_round_trip(self):
+        from datetime import date
+        from decimal import Decimal
+        from django.db import models
+        from dwellings.archive import _to_column, _from_column, NULL, NULL_DATE
+        fields = [(models.DateField(null=True), [date(2001, 2, 3), None]),
+                (models.DecimalField(max_digits=9, decimal_places=2),
+                    [Decimal('1234.5'), Decimal('-0.01'), Decimal('0')]),
+                (models.IntegerField(null=True), [0, 42, None]),
+                (models.ForeignKey('Unit', null=True), [7, None]),
+                (models.NullBooleanField(), [True, False, None]),
+                (models.CharField(max_length=10), ['', 'Apt 3'])]
+        for field, values in fields:
+            for value in values:
+                self.assertEqual(_from_column(field, _to_column(field, value)),
+                        value)
+        self.assertEqual(_to_column(models.DateField(null=True), None), NULL_DATE)
+        self.assertEqual(_to_column(models.IntegerField(null=True), None), NULL)
+        self.assertEqual(_to_column(models.DecimalField(max_digits=9,
+            decimal_places=2), Decimal('12.34')), 1234)
+
+class DeedCheckTest(TestCase):
+    def test_parse_refuses_non_finite_prices(self):
+        from dwellings.deeds import _parse
+        row = {'prop': '1', 'person': '2', 'date': '2012-01-31'}
+        for price in ('NaN', 'Infinity', '-inf', 'ten', '1000000000000',
+                '1.005'):
+            self.assertRaises(ValueError, _parse, dict(row, price=price))
+        self.assertRaises(ValueError, _parse, dict(row, price=None))
+        self.assertRaises(ValueError, _parse, {'prop': '1'})
+        self.assertEqual(str(_parse(dict(row, price='1.50'))[3]), '1.50')
+
+    def test_check(self):
+        from datetime import date
+        from decimal import Decimal
+        from dwellings.deeds import check
+        d = date(2012, 1, 31)
+        props = {1: (5, None), 2: (None, 6), 3: (5, 6), 4: (None, None)}
+        price = Decimal('1000')
+        parsed = {0: (1, 10, d, price), 1: (1, 11, d, Decimal('999')),
+                2: (2, 10, d, price), 3: (3, 10, d, price),
+                4: (4, 10, d, price), 5: (2, 12, d, price)}
+        errors = check(parsed, props, set([10, 11]), {})
+        self.assertEqual(sorted(errors), [0, 1, 3, 4, 5])
+        self.assertTrue('different prices' in errors[0])
+        self.assertTrue('estate or a building' in errors[3])
+        self.assertTrue('estate or a building' in errors[4])
+        self.assertEqual(errors[5], 'no person 12')
+        # a deed already recorded is a duplicate, a different one a conflict
+        existing = {(2, d): set([(10, price)])}
+        self.assertEqual(check({0: (2, 10, d, price)}, props, set([10]),
+            existing), {})
+        self.assertTrue('conflicts' in check({0: (2, 10, d, Decimal('1'))},
+            props, set([10]), existing)[0])
+
+    def test_a_bad_row_rejects_its_whole_deed(self):
+        from datetime import date
+        from dwellings.deeds import reject_deeds
+        d = date(2012, 1, 31)
+        deeds = {0: (1, d), 1: (1, d), 2: (2, d), 3: None}
+        errors = reject_deeds(deeds, {1: 'negative price', 3: 'missing prop'})
+        self.assertEqual(sorted(errors), [0, 1, 3])
+        self.assertEqual(errors[0], 'row 1 of the same deed is bad')
+
+class TenancyTest(TestCase):
+    def test_co_occupants_are_overlapping_tenancies(self):
+        from datetime import date
+        from dwellings.screening import tenancies, overlapping
+        transfers = [(date(2010, 1, 1), 1, None),
+                (date(2012, 1, 1), 1, date(2012, 6, 1)),
+                (date(2012, 1, 1), 2, None),
+                (date(2013, 1, 1), 2, None), (date(2013, 1, 1), 3, None),
+                (date(2014, 1, 1), None, None), (date(2015, 1, 1), 4, None)]
+        found = tenancies(transfers)
+        self.assertEqual(found, [(1, date(2010, 1, 1), date(2012, 6, 1)),
+            (2, date(2012, 1, 1), date(2014, 1, 1)),
+            (3, date(2013, 1, 1), date(2014, 1, 1)),
+            (4, date(2015, 1, 1), None)])
+        self.assertEqual(overlapping(found, set([1, 3, 4])),
+                {1: set([2]), 3: set([2])})
@@ -0,0 +1,180 @@
+"""Vacancy rate, turnover and tenancy length per prop, city or zip code.
+
+OccupantTransfers, live and archived, are streamed once, sorted by unit and
+date, and turned into occupied and vacant intervals for each unit: a
+transfer with no occupant starts a vacancy, an eviction_date ends a tenancy
+early. Rather than
+looking at every unit on every day, each interval only adds a +1 where it
+starts and a -1 where it ends to its group's running counts, and a single
+sweep over those change points integrates them into unit-days per day,
+month or year bucket."""
+import datetime
+from dwellings import archive
+from dwellings.models import Unit, OccupantTransfers
+
+DAY, MONTH, YEAR = 'day', 'month', 'year'
+GROUPINGS = ('prop', 'city', 'zip_code')
+
+def bucket_start(date, period):
+    if period == DAY:
+        return date
+    elif period == MONTH:
+        return date.replace(day=1)
+    return date.replace(month=1, day=1)
+
+def next_bucket(bucket, period):
+    if period == DAY:
+        return bucket + datetime.timedelta(days=1)
+    elif period == MONTH:
+        return (bucket.replace(year=bucket.year + 1, month=1)
+                if bucket.month == 12 else bucket.replace(month=bucket.month + 1))
+    return bucket.replace(year=bucket.year + 1)
+
+def intervals(transfers):
+    """transfers are (date, occupant id or None, eviction date or None) for
+    one unit, oldest first. Yields (start, end or None, occupants) where
+    occupants is a frozenset, empty while vacant. Transfers on the same date
+    are roommates moving in together."""
+    by_date = []
+    for date, occupant_id, eviction_date in transfers:
+        if not by_date or by_date[-1][0] != date:
+            by_date.append((date, set(), []))
+        if occupant_id is not None:
+            by_date[-1][1].add(occupant_id)
+            by_date[-1][2].append(eviction_date)
+    current = None
+    for i, (date, occupants, evictions) in enumerate(by_date):
+        following = by_date[i + 1][0] if i + 1 < len(by_date) else None
+        end = following
+        if occupants and evictions and None not in evictions:
+            evicted = max(evictions)
+            if following is None or evicted < following:
+                end = evicted
+        for interval in ((date, end, frozenset(occupants)),
+                (end, following, frozenset()) if end != following else None):
+            if interval is None:
+                continue
+            if current and current[2] == interval[2] and current[1] == interval[0]:
+                current = (current[0], interval[1], current[2])
+            else:
+                if current:
+                    yield current
+                current = interval
+    if current:
+        yield current
+
+class _Group(object):
+    def __init__(self):
+        self.occupied = {} # date -> change in number of occupied units
+        self.known = {} # date -> change in number of units with a history
+        self.move_ins = {} # date -> number of tenancies starting
+        self.tenancies = [] # (end, days) of finished tenancies
+
+    def add(self, start, end, occupants, before):
+        for deltas in ((self.occupied,) if occupants else ()) + (self.known,):
+            deltas[start] = deltas.get(start, 0) + 1
+            if end is not None:
+                deltas[end] = deltas.get(end, 0) - 1
+        if occupants:
+            if occupants != before:
+                self.move_ins[start] = self.move_ins.get(start, 0) + 1
+            if end is not None:
+                self.tenancies.append((end, (end - start).days))
+
+def integrate(deltas, start, end, period):
+    """sweeps the step function given by deltas (date -> change) over
+    [start, end), returns a list of (bucket, sum over the bucket's days)"""
+    points = sorted(deltas.items())
+    level, i = 0, 0
+    while i < len(points) and points[i][0] <= start:
+        level += points[i][1]
+        i += 1
+    sums, bucket, cursor = [], bucket_start(start, period), start
+    while cursor < end:
+        bucket_end = min(next_bucket(bucket, period), end)
+        total = 0
+        while cursor < bucket_end:
+            step = points[i][0] if (i < len(points) and
+                    points[i][0] < bucket_end) else bucket_end
+            total += level * (step - cursor).days
+            cursor = step
+            while i < len(points) and points[i][0] <= cursor:
+                level += points[i][1]
+                i += 1
+        sums.append((bucket, total))
+        bucket = next_bucket(bucket, period)
+    return sums
+
+def _count_by_bucket(dated, start, end, period):
+    counts = {}
+    for date, count in dated:
+        if start <= date < end:
+            bucket = bucket_start(date, period)
+            counts[bucket] = counts.get(bucket, 0) + count
+    return counts
+
+def _unit_groups(group_by):
+    """returns a dictionary mapping unit id to its prop, city or zip code"""
+    groups = {}
+    for (unit_id, prop_id, estate_city, estate_zip, building_city,
+            building_zip) in Unit.objects.values_list('id', 'prop',
+                    'prop__estate__city', 'prop__estate__zip_code',
+                    'prop__building__estate__city',
+                    'prop__building__estate__zip_code').iterator():
+        groups[unit_id] = (prop_id if group_by == 'prop' else
+                estate_city or building_city if group_by == 'city' else
+                (estate_zip or building_zip or '')[:5])
+    return groups
+
+def _units(rows):
+    """groups (unit, date, occupant, eviction date) rows sorted by unit"""
+    unit_id, transfers = None, []
+    for row in rows:
+        if row[0] != unit_id:
+            if transfers:
+                yield unit_id, transfers
+            unit_id, transfers = row[0], []
+        transfers.append(row[1:])
+    if transfers:
+        yield unit_id, transfers
+
+def vacancy(start, end, period=MONTH, group_by='prop'):
+    """returns a dictionary mapping each prop, city or zip code to a list with
+    one dictionary per day, month or year bucket in [start, end) holding:
+    unit_days    days of units with a known occupancy history
+    vacancy_rate fraction of those days the units were vacant
+    turnover     number of new tenancies that started
+    average_tenancy_days  mean length of the tenancies that ended"""
+    if group_by not in GROUPINGS:
+        raise ValueError('group_by must be one of {}'.format(GROUPINGS))
+    unit_groups = _unit_groups(group_by)
+    groups = {}
+    rows = archive.combined(OccupantTransfers, ('unit_id', 'date', 'id',
+        'occupant_id', 'eviction_date'), OccupantTransfers.objects.all())
+    for unit_id, transfers in _units((unit_id, date, occupant_id, eviction)
+            for unit_id, date, row_id, occupant_id, eviction in rows):
+        group = groups.setdefault(unit_groups.get(unit_id), _Group())
+        before = frozenset()
+        for interval_start, interval_end, occupants in intervals(transfers):
+            group.add(interval_start, interval_end, occupants, before)
+            if occupants:
+                before = occupants
+    results = {}
+    for key, group in groups.items():
+        occupied = dict(integrate(group.occupied, start, end, period))
+        move_ins = _count_by_bucket(group.move_ins.items(), start, end, period)
+        tenancy_days = {}
+        for ended, days in group.tenancies:
+            if start <= ended < end:
+                tenancy_days.setdefault(bucket_start(ended, period), []).append(days)
+        series = []
+        for bucket, unit_days in integrate(group.known, start, end, period):
+            lengths = tenancy_days.get(bucket, [])
+            series.append({'period': bucket, 'unit_days': unit_days,
+                'vacancy_rate': (1 - float(occupied[bucket]) / unit_days
+                    if unit_days else None),
+                'turnover': move_ins.get(bucket, 0),
+                'average_tenancy_days': (float(sum(lengths)) / len(lengths)
+                    if lengths else None)})
+        results[key] = series
+    return results
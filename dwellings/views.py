@@ -1 +1,55 @@
-# Create your views here.
+from dwellarch import api
+from places.models import Estate, Building
+from dwellings.models import Prop, Unit, OccupantTransfers
+
+def _addresses(prop_filter, with_props=False):
+    """related() for api.page: the rows an address is read from, so that
+    changing any of them changes the ETag"""
+    def related(ids):
+        via_prop = {'prop__' + prop_filter: ids}
+        rows = [Building.objects.filter(**via_prop),
+                Estate.objects.filter(**via_prop),
+                Estate.objects.filter(**{'building__prop__' + prop_filter: ids})]
+        if with_props:
+            rows.append(Prop.objects.filter(**{prop_filter: ids}))
+        return {}, rows
+    return related
+
+def _address(prop):
+    # no state: Estate.state isn't a database field
+    land = prop.land()
+    return {'address': land.address, 'city': land.city,
+            'zip_code': land.zip_code}
+
+def _prop(prop, context):
+    return dict(_address(prop), id=prop.id, estate=prop.estate_id,
+            building=prop.building_id)
+
+def _unit(unit, context):
+    return dict(_address(unit.prop), id=unit.id, prop=unit.prop_id,
+            unit=unit.number)
+
+def _transfer(transfer, context):
+    return {'id': transfer.id, 'unit': transfer.unit_id, 'date': transfer.date,
+            'occupant': transfer.occupant_id,
+            'person': transfer.occupant and transfer.occupant.person_id,
+            'eviction_date': transfer.eviction_date}
+
+def props(request):
+    """GET /api/props/?after=<id>&limit=<n>"""
+    return api.page(request, Prop.objects.select_related('estate',
+        'building__estate'), _prop, related=_addresses('id__in'))
+
+def units(request):
+    """GET /api/units/?after=<id>&limit=<n>"""
+    return api.page(request, Unit.objects.select_related('prop__estate',
+        'prop__building__estate'), _unit, related=_addresses('unit__id__in',
+            with_props=True))
+
+def occupancy(request, unit_id=None):
+    """GET /api/occupancy/?after=<date>.<id>&limit=<n>, oldest first,
+    or /api/units/<unit_id>/occupancy/ for one unit's history"""
+    transfers = OccupantTransfers.objects.select_related('occupant')
+    if unit_id is not None:
+        transfers = transfers.filter(unit=unit_id)
+    return api.page(request, transfers, _transfer, date_field='date')
@@ -0,0 +1,43 @@
+import multiprocessing
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import connections
+from jobs import queue
+
+def _worker(until_empty):
+    queue.work(until_empty)
+
+class Command(BaseCommand):
+    help = 'Runs queued jobs in worker processes. See jobs/queue.py'
+    option_list = BaseCommand.option_list + (
+            make_option('--processes', type='int', default=1,
+                help='Number of worker processes'),
+            make_option('--until-empty', action='store_true', dest='until_empty',
+                default=False, help='Stop once no jobs are due'),
+            make_option('--requeue-stale', type='int', dest='requeue_stale',
+                metavar='MINUTES', default=None, help='First put back jobs \
+                        that have been running for longer than MINUTES, left \
+                        by workers that died'),
+            make_option('--stats', action='store_true', default=False,
+                help='Print run times of finished jobs and exit'),
+    )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for row in queue.stats():
+                self.stdout.write('{name}\t{status}\t{jobs} jobs\t'
+                        '{average:.3f}s average\t{longest:.3f}s longest'.format(**row))
+            return
+        if options['requeue_stale'] is not None:
+            self.stdout.write('{} stale jobs requeued'.format(
+                queue.requeue_stale(options['requeue_stale'])))
+        # each worker has to open its own database connection
+        for connection in connections.all():
+            connection.close()
+        workers = [multiprocessing.Process(target=_worker,
+            args=(options['until_empty'],))
+            for i in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,40 @@
+from django.db import models
+
+class Job(models.Model):
+    """A call of a module-level function to be made by a worker process
+    rather than during a request. See jobs.queue"""
+    name = models.CharField('function', help_text="Dotted path of the \
+            function to call, e.g. 'people.contacts.rebuild_index'",
+            max_length=128)
+    key = models.CharField('deduplication key', help_text='Only one pending \
+            job may have a given key. Leave blank to always add the job.',
+            max_length=128, blank=True, db_index=True)
+    args = models.TextField('json arguments', default='[]')
+    kwargs = models.TextField('json keyword arguments', default='{}')
+
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICES = (
+            (PENDING, 'Pending'),
+            (RUNNING, 'Running'),
+            (DONE, 'Done'),
+            (FAILED, 'Failed'),
+    )
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES,
+            default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True, default=None)
+    finished = models.DateTimeField(blank=True, null=True, default=None)
+    seconds = models.FloatField('run time', blank=True, null=True, default=None)
+    error = models.TextField('last error', blank=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.name, self.key or self.id)
+
+    class Meta:
+        index_together = [['status', 'run_after']]
@@ -0,0 +1,174 @@
+"""A job queue kept in the project database.
+
+enqueue() records a call of a module-level function; worker processes
+started by the run_jobs command claim jobs one at a time and run them. On
+PostgreSQL a job is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of workers can poll the same table without waiting on each other or
+running a job twice. A job that raises is retried after an exponentially
+growing delay until it has used up max_attempts. Jobs with the same key are
+only queued once while one is still pending, so saving the same thing many
+times in a row only causes one recomputation. On PostgreSQL that is enforced
+by a partial unique index (jobs/sql/job.postgresql_psycopg2.sql, created by
+syncdb), so two processes queueing the same key at once still make one job.
+
+A job whose worker died stays running; run_jobs --requeue-stale puts such
+jobs back when they have been running for longer than a given time."""
+import datetime
+import json
+import time
+import traceback
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Avg, Count, F, Max, Sum
+from django.utils import timezone
+from jobs.models import Job
+
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+POLL_SECONDS = 1.0
+STALE_MINUTES = 60
+
+def function_path(function):
+    if isinstance(function, str):
+        return function
+    return '{}.{}'.format(function.__module__, function.__name__)
+
+def import_function(path):
+    module_name, function_name = path.rsplit('.', 1)
+    return getattr(__import__(module_name, fromlist=[function_name]),
+            function_name)
+
+@transaction.commit_on_success
+def enqueue(function, args=(), kwargs=None, key='', delay=0, max_attempts=5):
+    """queues function (or its dotted path) to be called with args and
+    kwargs, which must be json serializable, after delay seconds. If a job
+    with the same key is already pending, that job is returned instead."""
+    if key:
+        pending = Job.objects.filter(key=key, status=Job.PENDING)[:1]
+        if pending:
+            return pending[0]
+    savepoint = transaction.savepoint()
+    try:
+        job = Job.objects.create(name=function_path(function),
+                args=json.dumps(list(args)), kwargs=json.dumps(kwargs or {}),
+                key=key, max_attempts=max_attempts,
+                run_after=timezone.now() + datetime.timedelta(seconds=delay))
+    except IntegrityError:
+        # another process queued the same key since the check above
+        transaction.savepoint_rollback(savepoint)
+        return Job.objects.filter(key=key).order_by('-id')[0]
+    transaction.savepoint_commit(savepoint)
+    return job
+
+def backoff(attempts):
+    """seconds to wait before retrying a job that has failed attempts times"""
+    return min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+CLAIM_SQL = """
+UPDATE {table} SET status = %s, started = %s, attempts = attempts + 1
+WHERE id = (
+    SELECT id FROM {table}
+    WHERE status = %s AND run_after <= %s
+    ORDER BY run_after, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED)
+RETURNING id"""
+
+@transaction.commit_on_success
+def claim():
+    """marks the next due job as running and returns it, or returns None"""
+    now = timezone.now()
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute(CLAIM_SQL.format(table=Job._meta.db_table),
+                [Job.RUNNING, now, Job.PENDING, now])
+        row = cursor.fetchone()
+        return Job.objects.get(id=row[0]) if row else None
+    # other databases: whichever worker flips the status first gets the job
+    for job in Job.objects.filter(status=Job.PENDING, run_after__lte=now
+            ).order_by('run_after', 'id')[:10]:
+        if Job.objects.filter(id=job.id, status=Job.PENDING).update(
+                status=Job.RUNNING, started=now, attempts=job.attempts + 1):
+            return Job.objects.get(id=job.id)
+    return None
+
+def run(job):
+    """calls a claimed job's function and records the outcome"""
+    start = time.time()
+    try:
+        import_function(job.name)(*json.loads(job.args),
+                **json.loads(job.kwargs))
+    except Exception:
+        transaction.rollback_unless_managed()
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + datetime.timedelta(
+                    seconds=backoff(job.attempts))
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.error = ''
+    job.finished = timezone.now()
+    job.seconds = time.time() - start
+    try:
+        with transaction.commit_on_success():
+            job.save()
+    except IntegrityError:
+        # a job with the same key was queued while this one ran and will
+        # make the same call, so this one isn't retried
+        job.status = Job.FAILED
+        with transaction.commit_on_success():
+            job.save()
+    return job.status == Job.DONE
+
+def requeue_stale(minutes=STALE_MINUTES):
+    """puts back jobs left running longer than minutes by a worker that died.
+    A job that is still running that long would be run twice, so this is
+    only done when asked for (run_jobs --requeue-stale). A stale job that
+    has used up its attempts, perhaps by killing its worker each time, is
+    marked failed, and so is one whose key has been queued again since it
+    started (or an older one of two stale jobs with a key), since the newer
+    job will make the same call. Returns the number of jobs put back."""
+    while True:
+        try:
+            return _requeue_stale(timezone.now() - datetime.timedelta(
+                minutes=minutes))
+        except IntegrityError:
+            pass # a job with one of the keys was queued meanwhile, look again
+
+@transaction.commit_on_success
+def _requeue_stale(started_before):
+    stale = Job.objects.filter(status=Job.RUNNING,
+            started__lt=started_before)
+    failed = dict(status=Job.FAILED, finished=timezone.now(),
+            error='The worker running it stopped')
+    stale.filter(attempts__gte=F('max_attempts')).update(**failed)
+    stale.filter(key__in=Job.objects.filter(status=Job.PENDING).exclude(
+        key='').values('key')).update(**failed)
+    newest = {} # only one job per key may be pending
+    for job_id, key in stale.exclude(key='').values_list('id', 'key'):
+        newest[key] = max(job_id, newest.get(key, 0))
+    stale.exclude(key='').exclude(id__in=list(newest.values())).update(**failed)
+    return stale.update(status=Job.PENDING)
+
+def work(until_empty=False, poll=POLL_SECONDS):
+    """claims and runs jobs until there are none left (if until_empty) or
+    forever, returns the number of jobs run"""
+    count = 0
+    while True:
+        job = claim()
+        if job is None:
+            if until_empty:
+                return count
+            time.sleep(poll)
+            continue
+        run(job)
+        count += 1
+
+def stats():
+    """returns per-function counts and timings of finished jobs"""
+    return list(Job.objects.exclude(seconds=None).order_by().values(
+        'name', 'status').annotate(jobs=Count('id'), seconds=Sum('seconds'),
+            average=Avg('seconds'), longest=Max('seconds')).order_by('name',
+                'status'))
@@ -0,0 +1,3 @@
+-- Only one pending job may have a given non-blank key; see jobs.queue.enqueue
+CREATE UNIQUE INDEX jobs_job_pending_key ON jobs_job ("key")
+    WHERE status = 'P' AND "key" <> '';
@@ -0,0 +1,27 @@
+"""
+This file demonstrates writing tests using the unittest module. These will pass
+when you run "manage.py test".
+
+Replace this with more appropriate tests for your application.
+"""
+
+from django.test import TestCase
+
+
+class SimpleTest(TestCase):
+    def test_basic_addition(self):
+        """
+        Tests that 1 + 1 always equals 2.
+        """
+        self.assertEqual(1 + 1, 2)
+
+class BackoffTest(TestCase):
+    def test_backoff_doubles_up_to_limit(self):
+        from jobs.queue import backoff, MAX_BACKOFF_SECONDS
+        self.assertEqual([backoff(n) for n in (1, 2, 3)], [30, 60, 120])
+        self.assertEqual(backoff(30), MAX_BACKOFF_SECONDS)
+
+    def test_function_path(self):
+        from jobs.queue import function_path, import_function
+        self.assertEqual(function_path(import_function('os.path.join')),
+                'posixpath.join')
@@ -0,0 +1,138 @@
+"""Normalized reverse lookup of phone numbers, email addresses and online links.
+
+Every Phone, Email and URI row gets one ContactKey row holding the normalized
+contact and the interval it was held. Given any number of contacts, lookup()
+answers who ever held each of them, and when, with a single indexed query."""
+import re
+from urllib.parse import urlsplit, urlunsplit
+from django.db import transaction
+from django.db.models import Q
+from people.models import ContactKey, Phone, Email, URI
+
+BATCH_SIZE = 1000
+DEFAULT_PORTS = {'http': '80', 'https': '443', 'ftp': '21'}
+EXTENSION = re.compile(r'(?<![A-Za-z])(?:x|ext\.?|extension)\s*\d+$', re.I)
+HOST = re.compile(r'[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}(?::\d+)?$')
+KEYPAD = dict((letter, str(digit)) for digit, letters in enumerate(
+    ['', '', 'ABC', 'DEF', 'GHI', 'JKL', 'MNO', 'PQRS', 'TUV', 'WXYZ'])
+    for letter in letters)
+
+def normalize_phone(number):
+    """returns the E.164 form of a phone number, assuming North America
+    (+1) when no country code is given, or '' if there are no digits. An
+    extension ("x3", "ext. 3") is dropped and letters of a vanity number
+    ("1-800-FLOWERS") are read as the keypad digits they stand for."""
+    number = EXTENSION.sub('', number.strip()).strip()
+    digits = re.sub(r'\D', '', ''.join(KEYPAD.get(c, c)
+        for c in number.upper()))
+    if not digits:
+        return ''
+    if number.startswith('+'):
+        return '+' + digits
+    if number.startswith('011'): # dialed international prefix
+        return '+' + digits[3:]
+    if len(digits) == 11 and digits.startswith('1'):
+        return '+' + digits
+    return '+1' + digits
+
+def normalize_email(addr):
+    return addr.strip().lower()
+
+def normalize_uri(uri):
+    """returns uri with lowercased scheme and host, default port, fragment
+    and trailing slash removed, so that equivalent links compare equal"""
+    uri = uri.strip()
+    if '://' not in uri:
+        uri = 'http://' + uri
+    parts = urlsplit(uri)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if netloc.endswith(':' + DEFAULT_PORTS.get(scheme, '')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parts.path.rstrip('/')
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+def contact_key(value):
+    """returns (kind, key) for a raw phone number, email address or link.
+    A value is a link if it has a "/" or starts with a dotted host name, an
+    email address if it has an "@", and a phone number otherwise."""
+    value = value.strip()
+    if '/' in value or ('@' not in value and HOST.match(value)):
+        return ContactKey.URI, normalize_uri(value)
+    elif '@' in value:
+        return ContactKey.EMAIL, normalize_email(value)
+    else:
+        return ContactKey.PHONE, normalize_phone(value)
+
+def _key_for(contact):
+    """returns an unsaved ContactKey for a Phone, Email or URI instance"""
+    if isinstance(contact, Phone):
+        return ContactKey(kind=ContactKey.PHONE,
+                key=normalize_phone(str(contact.phone_number)),
+                start=contact.start_date or contact.valid_date,
+                end=contact.end_date or contact.invalid_date,
+                person_id=contact.person_id, source_id=contact.pk)
+    elif isinstance(contact, Email):
+        return ContactKey(kind=ContactKey.EMAIL,
+                key=normalize_email(contact.addr),
+                start=contact.date, end=contact.term,
+                person_id=contact.person_id, source_id=contact.pk)
+    else:
+        return ContactKey(kind=ContactKey.URI,
+                key=normalize_uri(contact.uri),
+                start=contact.date, end=contact.del_date,
+                person_id=contact.person_id, source_id=contact.pk)
+
+def _kind_of(contact):
+    return (ContactKey.PHONE if isinstance(contact, Phone) else
+            ContactKey.EMAIL if isinstance(contact, Email) else
+            ContactKey.URI)
+
+def index_contact(contact):
+    """replaces the ContactKey for a single saved Phone, Email or URI"""
+    unindex_contact(contact)
+    _key_for(contact).save()
+
+def unindex_contact(contact):
+    ContactKey.objects.filter(kind=_kind_of(contact),
+            source_id=contact.pk).delete()
+
+@transaction.commit_on_success
+def rebuild_index():
+    """drops and rebuilds every ContactKey from the contact tables in one
+    transaction, so lookups keep seeing the old index until it's done and
+    a failed rebuild leaves it as it was. Returns the number of keys written"""
+    ContactKey.objects.all().delete()
+    written = 0
+    for model in (Phone, Email, URI):
+        batch = []
+        for contact in model.objects.all().iterator():
+            batch.append(_key_for(contact))
+            if len(batch) >= BATCH_SIZE:
+                ContactKey.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        ContactKey.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+def lookup(values):
+    """returns a dictionary mapping each raw value (phone number, email or
+    link) to a list of (person, start, end) for everyone who ever held it,
+    ordered by start date. Uses one query however many values are given."""
+    values = list(values)
+    keys = dict((value, contact_key(value)) for value in values)
+    by_kind = {}
+    for kind, key in keys.values():
+        by_kind.setdefault(kind, set()).add(key)
+    query = None
+    for kind, kind_keys in by_kind.items():
+        q = Q(kind=kind, key__in=kind_keys)
+        query = q if query is None else query | q
+    found = {}
+    if query is not None:
+        for row in ContactKey.objects.filter(query).select_related(
+                'person').order_by('start'):
+            found.setdefault((row.kind, row.key), []).append(
+                    (row.person, row.start, row.end))
+    return dict((value, found.get(keys[value], [])) for value in values)
@@ -0,0 +1,122 @@
+"""Finding people entered more than once.
+
+Comparing every pair of people is out of the question, so people are first
+put into blocks by keys a duplicate would most likely share: the soundex of
+a family name plus the first given initial, a normalized phone number or
+email address (from the ContactKey index, see people.contacts), or an
+identification number. Only people sharing a block are compared, the
+comparisons are scored in parallel chunks, and the pairs come back best
+first as merge candidates."""
+import multiprocessing
+import re
+from people.models import NameChange, ContactKey, IdDoc
+
+MAX_BLOCK = 100 # bigger blocks are keys too common to mean anything
+CHUNK_SIZE = 5000
+MIN_SCORE = 0.3
+WEIGHTS = {
+        'id number': 0.6,
+        'email': 0.4,
+        'phone': 0.3,
+        'full name': 0.3,
+        'similar name': 0.1,
+}
+SOUNDEX_CODES = dict((letter, str(code)) for code, letters in enumerate(
+    ('AEIOUYHW', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R')) for letter in letters)
+
+def soundex(name):
+    letters = re.sub(r'[^A-Z]', '', name.upper())
+    if not letters:
+        return ''
+    code, last = letters[0], SOUNDEX_CODES[letters[0]]
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES[letter]
+        if digit != '0' and digit != last:
+            code += digit
+        if letter not in 'HW':
+            last = digit
+    return (code + '000')[:4]
+
+def _normalize_id(number):
+    return re.sub(r'[^A-Z0-9]', '', number.upper())
+
+def load_features():
+    """returns a dictionary mapping person id to the sets of things a
+    duplicate might share, loaded with one query per table"""
+    features = {}
+    def add(person_id, feature, value):
+        if value:
+            person = features.setdefault(person_id, {})
+            person.setdefault(feature, set()).add(value)
+    for person_id, given, family in NameChange.objects.values_list(
+            'person', 'prime_given_name', 'first_family_name').iterator():
+        given, family = given.strip().upper(), family.strip().upper()
+        add(person_id, 'full name', '{} {}'.format(given, family).strip())
+        add(person_id, 'similar name', '{}{}'.format(soundex(family),
+            given[:1]))
+    for person_id, kind, key in ContactKey.objects.filter(kind__in=(
+            ContactKey.PHONE, ContactKey.EMAIL)).values_list(
+                    'person', 'kind', 'key').iterator():
+        add(person_id, 'phone' if kind == ContactKey.PHONE else 'email', key)
+    for person_id, number in IdDoc.objects.values_list(
+            'name_registration__name_change__person', 'number').iterator():
+        add(person_id, 'id number', _normalize_id(number))
+    return features
+
+def candidate_pairs(features):
+    """returns the set of (person id, person id) pairs sharing a block"""
+    blocks = {}
+    for person_id, person in features.items():
+        for feature, values in person.items():
+            if feature == 'full name':
+                continue # 'similar name' already blocks these together
+            for value in values:
+                blocks.setdefault((feature, value), []).append(person_id)
+    pairs = set()
+    for members in blocks.values():
+        if 1 < len(members) <= MAX_BLOCK:
+            members.sort()
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    pairs.add((first, second))
+    return pairs
+
+def score(first, second):
+    """returns (score between 0 and 1, list of what the two have in common)"""
+    total, reasons = 0.0, []
+    for feature, weight in sorted(WEIGHTS.items(), key=lambda item: -item[1]):
+        if first.get(feature, set()) & second.get(feature, set()):
+            total += weight
+            reasons.append(feature)
+    return min(total, 1.0), reasons
+
+_features = None # set in each worker process by _init_worker
+
+def _init_worker(features):
+    global _features
+    _features = features
+
+def _score_chunk(pairs):
+    scored = []
+    for first, second in pairs:
+        value, reasons = score(_features[first], _features[second])
+        if value >= MIN_SCORE:
+            scored.append((value, first, second, reasons))
+    return scored
+
+def find_duplicates(processes=None, limit=None):
+    """returns a list of (score, person id, person id, reasons) for likely
+    duplicates, best first"""
+    features = load_features()
+    pairs = sorted(candidate_pairs(features))
+    chunks = [pairs[i:i + CHUNK_SIZE] for i in range(0, len(pairs), CHUNK_SIZE)]
+    pool = multiprocessing.Pool(processes, _init_worker, (features,))
+    try:
+        candidates = [candidate for scored in pool.imap_unordered(
+            _score_chunk, chunks) for candidate in scored]
+    finally:
+        pool.close()
+        pool.join()
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1],
+        candidate[2]))
+    return candidates[:limit] if limit else candidates
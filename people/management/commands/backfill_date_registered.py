@@ -0,0 +1,22 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from people import registration
+
+class Command(BaseCommand):
+    help = 'Sets NameChange.date_registered to the earliest NameRegistration \
+            date wherever the two differ'
+    option_list = BaseCommand.option_list + (
+            make_option('--dry-run', action='store_true', dest='dry_run',
+                default=False, help='Only list the mismatches'),
+    )
+
+    def handle(self, *args, **options):
+        found = registration.mismatches()
+        for name_change_id, registered, first in found:
+            self.stdout.write('{}\t{}\t{}'.format(name_change_id, registered,
+                first))
+        if options['dry_run']:
+            self.stdout.write('{} mismatches found'.format(len(found)))
+        else:
+            self.stdout.write('{} names updated'.format(
+                registration.backfill(found)))
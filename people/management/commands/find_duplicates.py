@@ -0,0 +1,18 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from people.duplicates import find_duplicates
+
+class Command(BaseCommand):
+    help = 'Lists pairs of people that are likely the same person, best first'
+    option_list = BaseCommand.option_list + (
+            make_option('--limit', type='int', default=100,
+                help='Number of pairs to list, 0 for all'),
+            make_option('--processes', type='int', default=None,
+                help='Number of worker processes, defaults to one per cpu'),
+    )
+
+    def handle(self, *args, **options):
+        for value, first, second, reasons in find_duplicates(
+                options['processes'], options['limit']):
+            self.stdout.write('{:.2f}\t{}\t{}\t{}'.format(value, first, second,
+                ', '.join(reasons)))
@@ -0,0 +1,94 @@
+"""Memoization of the name classification methods by (person, date).
+
+Person.allCurrentNames and NameChange.isAlias, isProperPseudonym,
+isLatestRealName and name_type each take several queries and are called
+over and over with the same person and date. @memoized keeps their results
+in a per-process LRU cache whose entries also expire after TTL_SECONDS, so
+changes made by other processes are picked up.
+
+A missing ondate means today, worked out when the method is called, and the
+cache key holds the actual date, so yesterday's answers are never served as
+today's. Every entry for a person is dropped at once when one of their
+NameChange or NameRegistration rows is written (see the receivers in
+people.models), by giving that person a new generation, which is part of
+the key; the old entries then fall out of the LRU. Generations are kept in
+Django's cache, so with a shared backend such as memcached a write in one
+process invalidates the entries of every process. With the default
+local-memory backend other processes see the write once their entries
+expire, within TTL_SECONDS.
+
+stats() is reported on /metrics (see dwellarch.instrument)."""
+import datetime
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+
+MAX_ENTRIES = 10000
+TTL_SECONDS = 300
+GENERATION_KEY = 'memo-generation-{}'
+
+_lock = threading.Lock()
+_entries = OrderedDict() # key -> (expires, value)
+_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'invalidated': 0}
+
+def memoized(person_id):
+    """decorator for a method taking an optional ondate; person_id(self)
+    returns the person whose names the result depends on"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, ondate=None):
+            ondate = ondate or datetime.date.today()
+            pid = person_id(self)
+            key = (method.__name__, self.pk, pid, generation(pid), ondate)
+            with _lock:
+                entry = _entries.get(key)
+                now = time.time()
+                if entry is not None:
+                    if entry[0] > now:
+                        _entries.move_to_end(key)
+                        _stats['hits'] += 1
+                        return _copy(entry[1])
+                    del _entries[key]
+                    _stats['expired'] += 1
+                _stats['misses'] += 1
+            value = method(self, ondate)
+            with _lock:
+                _entries[key] = (now + TTL_SECONDS, value)
+                while len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+                    _stats['evicted'] += 1
+            return _copy(value)
+        wrapper.uncached = method
+        return wrapper
+    return decorator
+
+def _copy(value):
+    return list(value) if isinstance(value, list) else value
+
+def generation(person_id):
+    return cache.get(GENERATION_KEY.format(person_id), 0)
+
+def invalidate(person_id):
+    """forgets every cached result for a person, in every process sharing
+    the cache backend. The new generation only has to differ from the old
+    ones. It outlives the entries made before it, so when it expires
+    nothing cached under generation 0 is still alive."""
+    cache.set(GENERATION_KEY.format(person_id), '{}-{}'.format(os.getpid(),
+        time.time()), TTL_SECONDS)
+    with _lock:
+        _stats['invalidated'] += 1
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def stats():
+    """returns the counters plus the current size and hit rate"""
+    with _lock:
+        counters = dict(_stats, entries=len(_entries))
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_rate'] = float(counters['hits']) / lookups if lookups else None
+    return counters
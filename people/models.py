@@ -5,6 +5,9 @@ from django.core.exceptions import ValidationError
 from django_localflavor_us.forms import USPhoneNumberField, USPSSelect, USSocialSecurityNumberField, USZipCodeField
 from django_localflavor_us.models import PhoneNumberField, USPostalCodeField # two-letter postal codes: state/territory/country
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from people import memo
 
 class Person(models.Model):
     """The purpose of this class is to supply an id for a person, corporation,  
@@ -53,7 +56,8 @@ class Person(models.Model):
     def children(self):
         return self.child_set
 
-    def allCurrentNames(self, ondate=datetime.date.today()):
+    @memo.memoized(lambda person: person.pk)
+    def allCurrentNames(self, ondate=None):
         """returns a list of name_changes where name_change was current 
         ondate (which defaults to today)"""
         all_names = list[self.name_change_set]
@@ -260,10 +264,13 @@ class NameChange(Name):
             return self.name_registration_set.dates('date','day')[0]
 
     def clean(self):
-        if self.date_registered != self.dateFirstRegistered():
+        from people.registration import first_registrations # imports models
+        first = (first_registrations([self.id]).get(self.id)
+                if self.id is not None else None)
+        if self.date_registered != first:
             if self.date_registered is None:
-                self.date_registered = self.dateFirstRegistered()
-            elif self.dateFirstRegistered is None:
+                self.date_registered = first
+            elif first is None:
                 raise ValidationError('First enter some registrations \
                         for this name before entering the registration \
                         date')
@@ -273,11 +280,13 @@ class NameChange(Name):
                         for this name. Leave this field blank and the \
                         correct date will be filled in automatically.')
 
-    def isAlias(self, ondate=datetime.date.today()):
+    @memo.memoized(lambda name: name.person_id)
+    def isAlias(self, ondate=None):
         """returns True if self hasn't been registered by ondate"""
         return not self.name_registration_set.exclude(date__gt=ondate).exists()
 
-    def isProperPseudonym(self, ondate=datetime.date.today()):
+    @memo.memoized(lambda name: name.person_id)
+    def isProperPseudonym(self, ondate=None):
         """returns True if self is a pseudonym but not an alias ondate,
         and not registered with both the DMV and Social Security, ondate"""
         if self.method==PSEUDONYM and not isAlias(ondate): 
@@ -288,7 +297,8 @@ class NameChange(Name):
         else:
             return False
 
-    def isLatestRealName(self, ondate=datetime.date.today()):
+    @memo.memoized(lambda name: name.person_id)
+    def isLatestRealName(self, ondate=None):
         """returns True if self is the latest instance ondate that's both 
         registered and not a pseudonym"""
         name_changes = self.person.name_change_set.exclude(date__gt=ondate)
@@ -298,20 +308,22 @@ class NameChange(Name):
         latest_registered_nonpseudo = registered_nonpseudos.latest('date_registered')
         return latest_registered_nonpseudo == self
 
-    def isCurrent(self, ondate=datetime.date.today()):
+    def isCurrent(self, ondate=None):
         """excludes name_changes with dates > ondate and
         returns True if self is any of the following in that set: 
         any Alias
         any ProperPseudonym
         the latest non-pseudonym registered name"""
+        ondate = ondate or datetime.date.today()
         if self.date > ondate:
             return False
-        elif self.isAlias() or self.isProperPseudonym():
+        elif self.isAlias(ondate) or self.isProperPseudonym(ondate):
             return True
         else: # last chance for True is if it's latest non-pseudonym registered name
             return isLatestRealName(ondate)
 
-    def name_type(self, ondate=datetime.date.today()):
+    @memo.memoized(lambda name: name.person_id)
+    def name_type(self, ondate=None):
         """returns one of the following strings: 
         'was not in use yet' for self.date > ondate
         'real and original' for the BIRTH method name_change if current ondate
@@ -434,3 +446,56 @@ class URI(models.Model):
             'portrait', 'photo of face', 'scan of fingerprints'", 
             max_length = 32)
 
+
+class ContactKey(models.Model):
+    """Reverse index of every phone number, email address and online link a
+    person has held. Rows are rebuilt from Phone, Email and URI whenever one
+    of those is saved so the normalized key can be looked up with an index
+    instead of scanning the contact tables. See people.contacts"""
+    PHONE = 'P'
+    EMAIL = 'E'
+    URI = 'U'
+    KIND_CHOICES = (
+            (PHONE, 'Phone'),
+            (EMAIL, 'Email'),
+            (URI, 'URI'),
+    )
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    key = models.CharField('normalized contact', max_length=254)
+    person = models.ForeignKey(Person)
+    source_id = models.IntegerField(help_text='id of the Phone, Email or URI \
+            row this key was built from')
+    start = models.DateField(blank=True, null=True, default=None)
+    end = models.DateField(blank=True, null=True, default=None)
+
+    class Meta:
+        index_together = [['kind', 'key']]
+        unique_together = [['kind', 'source_id']]
+
+@receiver(post_save, sender=Phone)
+@receiver(post_save, sender=Email)
+@receiver(post_save, sender=URI)
+def contact_saved(sender, instance, **kwargs):
+    from people import contacts
+    contacts.index_contact(instance)
+
+@receiver(post_delete, sender=Phone)
+@receiver(post_delete, sender=Email)
+@receiver(post_delete, sender=URI)
+def contact_deleted(sender, instance, **kwargs):
+    from people import contacts
+    contacts.unindex_contact(instance)
+
+@receiver(post_save, sender=NameRegistration)
+@receiver(post_delete, sender=NameRegistration)
+def name_registration_changed(sender, instance, **kwargs):
+    from people import registration
+    registration.refresh(instance.name_change_id)
+    for person_id in NameChange.objects.filter(id=instance.name_change_id
+            ).values_list('person', flat=True):
+        memo.invalidate(person_id)
+
+@receiver(post_save, sender=NameChange)
+@receiver(post_delete, sender=NameChange)
+def name_change_changed(sender, instance, **kwargs):
+    memo.invalidate(instance.person_id)
@@ -0,0 +1,53 @@
+"""Keeping NameChange.date_registered equal to the earliest NameRegistration.
+
+first_registrations() gets the earliest registration date of every name
+in one aggregate query, so a whole imported dataset can be checked and
+corrected in a few queries. NameChange.clean() and the NameRegistration
+receivers in people.models use it to check and keep single names current
+the same way."""
+from django.db import transaction
+from django.db.models import Min
+from people.models import NameChange, NameRegistration
+
+BATCH_SIZE = 1000
+
+def first_registrations(name_change_ids=None):
+    """returns a dictionary mapping name_change id to its earliest
+    registration date, for names that have been registered"""
+    registrations = NameRegistration.objects.all()
+    if name_change_ids is not None:
+        registrations = registrations.filter(name_change__in=name_change_ids)
+    # order_by() drops Meta.ordering, which would otherwise be grouped by too
+    return dict(registrations.order_by().values_list('name_change').annotate(
+        Min('date')))
+
+def mismatches():
+    """returns a list of (name_change id, date_registered, earliest
+    registration date) for every NameChange where the two differ"""
+    first = first_registrations()
+    return [(name_change_id, registered, first.get(name_change_id))
+            for name_change_id, registered in NameChange.objects.values_list(
+                'id', 'date_registered').iterator()
+            if registered != first.get(name_change_id)]
+
+def backfill(found=None):
+    """sets date_registered to the earliest registration date for every
+    mismatch (see mismatches()), one update per date per batch.
+    Returns the number of names updated."""
+    found = mismatches() if found is None else found
+    for i in range(0, len(found), BATCH_SIZE):
+        _update_batch(found[i:i + BATCH_SIZE])
+    return len(found)
+
+@transaction.commit_on_success
+def _update_batch(batch):
+    by_date = {}
+    for name_change_id, registered, first in batch:
+        by_date.setdefault(first, []).append(name_change_id)
+    for first, ids in by_date.items():
+        NameChange.objects.filter(id__in=ids).update(date_registered=first)
+
+def refresh(name_change_id):
+    """recomputes date_registered for a single name"""
+    NameChange.objects.filter(id=name_change_id).update(date_registered=
+            first_registrations([name_change_id]).get(name_change_id))
@@ -14,3 +14,110 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class ContactKeyTest(TestCase):
+    def test_normalize_phone(self):
+        from people.contacts import normalize_phone
+        self.assertEqual(normalize_phone('(314) 555-1212'), '+13145551212')
+        self.assertEqual(normalize_phone('1-314-555-1212'), '+13145551212')
+        self.assertEqual(normalize_phone('011 44 20 7946 0000'), '+442079460000')
+        self.assertEqual(normalize_phone('314-555-1212 ext. 3'), '+13145551212')
+        self.assertEqual(normalize_phone('314-555-1212x3'), '+13145551212')
+        self.assertEqual(normalize_phone('1-800-FLOWERS'), '+18003569377')
+
+    def test_normalize_uri(self):
+        from people.contacts import normalize_uri
+        self.assertEqual(normalize_uri('HTTP://Example.com:80/me/#top'),
+                'http://example.com/me')
+
+    def test_contact_key(self):
+        from people.contacts import contact_key
+        from people.models import ContactKey
+        self.assertEqual(contact_key(' Jo@Example.COM'),
+                (ContactKey.EMAIL, 'jo@example.com'))
+        self.assertEqual(contact_key('314.555.1212')[0], ContactKey.PHONE)
+        self.assertEqual(contact_key('www.example.com')[0], ContactKey.URI)
+        self.assertEqual(contact_key('example.com/jo')[0], ContactKey.URI)
+        self.assertEqual(contact_key('314-555-1212 ext 3'),
+                (ContactKey.PHONE, '+13145551212'))
+        self.assertEqual(contact_key('1-800-FLOWERS'),
+                (ContactKey.PHONE, '+18003569377'))
+
+class DuplicatesTest(TestCase):
+    def test_soundex(self):
+        from people.duplicates import soundex
+        self.assertEqual(soundex('Robert'), 'R163')
+        self.assertEqual(soundex('Rupert'), 'R163')
+        self.assertEqual(soundex('Ashcraft'), 'A261')
+        self.assertEqual(soundex('Tymczak'), 'T522')
+
+    def test_pairs_only_within_blocks(self):
+        from people.duplicates import candidate_pairs, score
+        features = {
+                1: {'similar name': set(['S530J']), 'phone': set(['+13145551212'])},
+                2: {'similar name': set(['S530J'])},
+                3: {'similar name': set(['D500A']), 'phone': set(['+13145551212'])},
+                4: {'similar name': set(['W420B'])},
+        }
+        self.assertEqual(candidate_pairs(features), set([(1, 2), (1, 3)]))
+        self.assertEqual(score(features[1], features[3]), (0.3, ['phone']))
+
+class MemoTest(TestCase):
+    def test_cached_per_person_and_date_until_invalidated(self):
+        import datetime
+        from people import memo
+        calls = []
+        class Name(object):
+            pk, person_id = 1, 7
+            @memo.memoized(lambda name: name.person_id)
+            def name_type(self, ondate=None):
+                calls.append(ondate)
+                return 'real'
+        memo.clear()
+        name = Name()
+        self.assertEqual(name.name_type(), 'real')
+        name.name_type(datetime.date.today())
+        self.assertEqual(calls, [datetime.date.today()])
+        name.name_type(datetime.date(2000, 1, 1))
+        self.assertEqual(len(calls), 2)
+        memo.invalidate(7)
+        name.name_type()
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(memo.stats()['hits'] >= 1)
+
+class NameTypesTest(TestCase):
+    def test_current_name_rules(self):
+        from datetime import date
+        from collections import namedtuple
+        from people.models import NameChange, NameRegistration
+        from people.views import name_types
+        Name = namedtuple('Name', 'id date method')
+        SSA, DMV = NameRegistration.SSA, NameRegistration.DMV
+        names = [Name(1, date(1980, 1, 1), NameChange.BIRTH),
+                Name(2, date(2000, 1, 1), 'MA'),
+                Name(3, date(2005, 1, 1), NameChange.PSEUDONYM),
+                Name(4, date(2006, 1, 1), NameChange.PSEUDONYM),
+                Name(5, date(2010, 1, 1), 'MA')]
+        agencies = {1: [(date(1980, 2, 1), SSA)],
+                2: [(date(2000, 3, 1), SSA), (date(2001, 1, 1), DMV)],
+                3: [(date(2005, 2, 1), DMV)],
+                4: [(date(2006, 2, 1), SSA), (date(2006, 3, 1), DMV)]}
+        self.assertEqual(name_types(names, agencies),
+                {2: 'real', 3: 'pseudonym', 5: 'alias'})
+
+class ApiCursorTest(TestCase):
+    def test_cursor_round_trip(self):
+        from datetime import date
+        from dwellarch.api import cursor, encode_cursor, BadRequest
+        class Request(object):
+            def __init__(self, **get):
+                self.GET = get
+        self.assertEqual(cursor(Request(), False), None)
+        self.assertEqual(cursor(Request(after='42'), False), (42,))
+        key = (date(2012, 1, 31), 123)
+        self.assertEqual(encode_cursor(key), '2012-01-31.123')
+        self.assertEqual(cursor(Request(after=encode_cursor(key)), True), key)
+        self.assertRaises(BadRequest, cursor, Request(after='x'), False)
+        self.assertRaises(BadRequest, cursor, Request(after='42'), True)
+        self.assertRaises(BadRequest, cursor, Request(after='2012-13-01.1'),
+                True)
@@ -1 +1,64 @@
-# Create your views here.
+import datetime
+from dwellarch import api
+from people.models import Person, NameChange, NameRegistration
+
+def name_types(names, agencies):
+    """classifies one person's names as of a date by the rules of
+    NameChange.isCurrent, without a query per name. names are the person's
+    NameChanges dated on or before that date; agencies maps a name's id to
+    the (date, agency) of its registrations made by that date. Returns a
+    dictionary mapping the id of each current name to 'alias', 'pseudonym'
+    or 'real'."""
+    types = {}
+    real = []
+    for name in names:
+        registered = agencies.get(name.id, [])
+        if not registered:
+            types[name.id] = 'alias'
+        elif name.method == NameChange.PSEUDONYM:
+            with_agency = set(agency for date, agency in registered)
+            if not (NameRegistration.SSA in with_agency and
+                    NameRegistration.DMV in with_agency):
+                types[name.id] = 'pseudonym'
+        else:
+            real.append((min(registered)[0], name.date, name.id))
+    if real:
+        types[max(real)[2]] = 'real'
+    return types
+
+def _names(ids):
+    """the names of the people on a page that are current today, the real
+    name first and then the newest"""
+    today = datetime.date.today()
+    names = NameChange.objects.filter(person__in=ids,
+            date__lte=today).order_by('-date', '-id')
+    registrations = NameRegistration.objects.filter(
+            name_change__person__in=ids, date__lte=today)
+    agencies = {}
+    for name_change_id, date, agency in registrations.values_list(
+            'name_change', 'date', 'registered_with'):
+        agencies.setdefault(name_change_id, []).append((date, agency))
+    by_person = {}
+    for name in names:
+        by_person.setdefault(name.person_id, []).append(name)
+    current = {}
+    for person_id, person_names in by_person.items():
+        types = name_types(person_names, agencies)
+        current[person_id] = sorted([(name, types[name.id])
+            for name in person_names if name.id in types],
+            key=lambda found: found[1] != 'real')
+    return current, [names, registrations]
+
+def _person(person, names):
+    person_names = names.get(person.id, [])
+    return {'id': person.id, 'corporation': person.corporation,
+            'government_agency': person.government_agency, 'sex': person.sex,
+            'name': person_names and person_names[0][0].full_name() or None,
+            'names': [{'name': name.full_name(), 'type': name_type,
+                'date': name.date, 'method': name.method,
+                'date_registered': name.date_registered}
+                for name, name_type in person_names]}
+
+def people(request):
+    """GET /api/people/?after=<id>&limit=<n>"""
+    return api.page(request, Person.objects.all(), _person, related=_names)
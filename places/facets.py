@@ -0,0 +1,205 @@
+"""In-memory faceted search over Buildings.
+
+Each facet value keeps a posting list of the buildings that have it, stored
+as a bitmap (a python int with bit n set for building id n). Filtering is a
+handful of bitwise and/or operations and every facet count is a popcount, so
+search() answers the matching ids and the counts for every facet in one call
+without touching the database. The index is built per process and kept
+current by the Building post_save and post_delete receivers in places.models.
+Those only see writes made in the same process, so the index is also rebuilt
+in a background thread once it is MAX_AGE_SECONDS old: other processes'
+writes show up in the counts within about that time. Building takes time
+linear in the number of buildings: each posting is assembled in a bytearray
+and turned into an int once."""
+import threading
+import time
+from django.db import connection
+from places.models import Building
+
+FACETS = ('bedrooms', 'bathrooms', 'partial_bathrooms', 'rooms',
+        'number_of_stories', 'style', 'type_construction', 'basement', 'pool',
+        'fire_place', 'foundation', 'elevator')
+MAX_AGE_SECONDS = 300
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+def bitmap_ids(bitmap):
+    """yields the building ids in a bitmap in ascending order. The bitmap
+    is turned into bytes once; shifting or masking the whole int for every
+    bit would copy it each time and take time quadratic in the largest id"""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield offset * 8 + low.bit_length() - 1
+            byte ^= low
+
+def _bitmap(ids, size):
+    """turns ids below size * 8 into a bitmap, setting bits in a bytearray
+    and converting it once instead of or-ing a growing int for every id"""
+    data = bytearray(size)
+    for building_id in ids:
+        data[building_id >> 3] |= 1 << (building_id & 7)
+    return int.from_bytes(bytes(data), 'little')
+
+class FacetIndex(object):
+    def __init__(self, facets=FACETS):
+        self.facets = facets
+        self.lock = threading.RLock() # guards the postings
+        self.build_lock = threading.Lock() # one build at a time
+        self.built = False
+        self.built_at = 0.0
+        self.rebuilding = False
+        self.pending = None # writes seen while a build is loading
+        self.clear()
+
+    def clear(self):
+        self.postings = dict((facet, {}) for facet in self.facets)
+        self.values = {} # building id -> tuple of facet values, for updates
+        self.all = 0
+
+    def build(self):
+        """loads every building with a single query"""
+        self.load(Building.objects.values_list('id', *self.facets).iterator())
+
+    def load(self, rows):
+        """replaces the index with rows of (building id, facet values...).
+        The postings are made without holding the lock, so searches go on
+        using the old ones meanwhile; writes the receivers report in the
+        meantime are applied again once the new postings are in place."""
+        with self.lock:
+            self.pending = []
+        try:
+            ids = dict((facet, {}) for facet in self.facets)
+            values = {}
+            for row in rows:
+                values[row[0]] = row[1:]
+                for facet, value in zip(self.facets, row[1:]):
+                    ids[facet].setdefault(value, []).append(row[0])
+            size = max(values) // 8 + 1 if values else 0
+            postings = dict((facet, dict((value, _bitmap(value_ids, size))
+                for value, value_ids in ids[facet].items()))
+                for facet in self.facets)
+            everything = _bitmap(values, size)
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            self.postings, self.values, self.all = postings, values, everything
+            self.built = True
+            self.built_at = time.time()
+            pending, self.pending = self.pending, None
+            for write, argument in pending:
+                write(argument)
+
+    def ensure_built(self):
+        """builds the index on first use and waits for it; when it is older
+        than MAX_AGE_SECONDS, rebuilds it in a background thread while
+        searches keep using the old one"""
+        if not self.built:
+            with self.build_lock:
+                if not self.built:
+                    self.build()
+            return
+        with self.lock:
+            if self.rebuilding or time.time() - self.built_at <= MAX_AGE_SECONDS:
+                return
+            self.rebuilding = True
+        thread = threading.Thread(target=self._rebuild)
+        thread.daemon = True
+        thread.start()
+
+    def _rebuild(self):
+        try:
+            with self.build_lock:
+                self.build()
+        finally:
+            self.rebuilding = False
+            connection.close() # the thread's own connection
+
+    def _add(self, building_id, values):
+        bit = 1 << building_id
+        for facet, value in zip(self.facets, values):
+            posting = self.postings[facet]
+            posting[value] = posting.get(value, 0) | bit
+        self.values[building_id] = values
+        self.all |= bit
+
+    def remove(self, building_id):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((self.remove, building_id))
+            self._remove(building_id)
+
+    def _remove(self, building_id):
+        values = self.values.pop(building_id, None)
+        if values is None:
+            return
+        mask = ~(1 << building_id)
+        for facet, value in zip(self.facets, values):
+            posting = self.postings[facet]
+            posting[value] &= mask
+            if not posting[value]:
+                del posting[value]
+        self.all &= mask
+
+    def update(self, building):
+        """re-indexes a saved Building instance"""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((self.update, building))
+            if not self.built:
+                return # the first search will load it
+            self._remove(building.pk)
+            self._add(building.pk, tuple(getattr(building, facet)
+                for facet in self.facets))
+
+    def _matching(self, facet, wanted):
+        """returns the bitmap of buildings having any of the wanted values"""
+        posting = self.postings[facet]
+        bitmap = 0
+        for value in wanted:
+            bitmap |= posting.get(value, 0)
+        return bitmap
+
+    def search(self, filters=None):
+        """filters maps a facet to a value or a list of acceptable values.
+        returns (bitmap of matching building ids, counts) where counts maps
+        every facet to {value: number of matching buildings}. The counts for
+        a facet ignore that facet's own filter, so they show how many
+        buildings each alternative value would give."""
+        filters = filters or {}
+        self.ensure_built()
+        with self.lock:
+            selected = {}
+            for facet, wanted in filters.items():
+                if not isinstance(wanted, (list, tuple, set)):
+                    wanted = [wanted]
+                selected[facet] = self._matching(facet, wanted)
+            matched = self.all
+            for bitmap in selected.values():
+                matched &= bitmap
+            counts = {}
+            for facet in self.facets:
+                base = self.all
+                for other, bitmap in selected.items():
+                    if other != facet:
+                        base &= bitmap
+                counts[facet] = dict((value, popcount(posting & base))
+                        for value, posting in self.postings[facet].items()
+                        if posting & base)
+            return matched, counts
+
+    def search_ids(self, filters=None, limit=None):
+        """returns (list of matching building ids ascending, counts)"""
+        matched, counts = self.search(filters)
+        ids = []
+        for building_id in bitmap_ids(matched):
+            if limit is not None and len(ids) >= limit:
+                break
+            ids.append(building_id)
+        return ids, counts
+
+index = FacetIndex()
@@ -0,0 +1,224 @@
+"""Offline geocoding of estates and radius search over them.
+
+Coordinates come from a locally loaded gazetteer: a csv file of either
+street addresses (address, city, zip_code, latitude, longitude) or zip code
+centroids (zip_code, latitude, longitude). Nothing is looked up over the
+network. Every address found is kept in GeocodeCache under its normalized
+form, and each geocoded Estate gets a geohash so a radius search only has to
+read the estates in the few geohash cells around the center."""
+import csv
+import math
+import re
+from django.db import connection, transaction
+from django.db.models import Q
+from places.models import Estate, GeocodeCache
+
+BATCH_SIZE = 1000
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.05
+GEOHASH_PRECISION = 12
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+ABBREVIATIONS = {
+        'STREET': 'ST', 'AVENUE': 'AVE', 'ROAD': 'RD', 'DRIVE': 'DR',
+        'BOULEVARD': 'BLVD', 'LANE': 'LN', 'COURT': 'CT', 'PLACE': 'PL',
+        'TERRACE': 'TER', 'PARKWAY': 'PKWY', 'HIGHWAY': 'HWY',
+        'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+        'APARTMENT': 'APT', 'SUITE': 'STE',
+}
+
+def normalize_address(address, city='', zip_code=''):
+    """returns an uppercased, punctuation-free address with standard USPS
+    abbreviations followed by the city and five digit zip code"""
+    words = re.sub(r'[^A-Z0-9 ]', ' ', address.upper()).split()
+    words = [ABBREVIATIONS.get(word, word) for word in words]
+    city = ' '.join(re.sub(r'[^A-Z ]', ' ', city.upper()).split())
+    return '{}|{}|{}'.format(' '.join(words), city, zip5(zip_code))
+
+def zip5(zip_code):
+    return re.sub(r'\D', '', zip_code)[:5]
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, value, even = [], 0, 0, True
+    while len(code) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            code.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(code)
+
+def cell_size(precision):
+    """returns (height, width) in degrees of a geohash cell"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def distance(lat1, lon1, lat2, lon2):
+    """returns the great-circle distance in miles"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) *
+            math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+def covering_cells(latitude, longitude, miles):
+    """returns the geohash prefixes of the cell holding the center and its
+    eight neighbors, at the finest precision where a cell is still at least
+    as big as the search radius, so together they cover the whole circle.
+    An empty list means the radius is too big to narrow down by cell."""
+    dlat = miles / MILES_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(latitude)), 0.01)
+    precision = 0
+    while precision < GEOHASH_PRECISION:
+        height, width = cell_size(precision + 1)
+        if height < dlat or width < dlon:
+            break
+        precision += 1
+    if precision == 0:
+        return []
+    height, width = cell_size(precision)
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = max(-90.0, min(90.0, latitude + i * height))
+            lon = (longitude + j * width + 180.0) % 360.0 - 180.0
+            cells.add(geohash(lat, lon, precision))
+    return sorted(cells)
+
+def estates_within(latitude, longitude, miles):
+    """returns a list of (estate_id, distance in miles) for every geocoded
+    estate within miles of the given point, nearest first"""
+    query = Q()
+    for cell in covering_cells(latitude, longitude, miles):
+        query |= Q(geohash__startswith=cell)
+    candidates = Estate.objects.filter(query, latitude__isnull=False
+            ).values_list('id', 'latitude', 'longitude')
+    found = []
+    for estate_id, lat, lon in candidates.iterator():
+        d = distance(latitude, longitude, lat, lon)
+        if d <= miles:
+            found.append((estate_id, d))
+    found.sort(key=lambda pair: pair[1])
+    return found
+
+def box_circle(south, west, north, east):
+    """returns (latitude, longitude, miles) of the box's center and the
+    distance to its farthest corner, which away from the equator is one of
+    the two nearer the equator"""
+    center_lat, center_lon = (south + north) / 2, (west + east) / 2
+    return center_lat, center_lon, max(distance(center_lat, center_lon, lat,
+        lon) for lat in (south, north) for lon in (west, east))
+
+def estates_in_box(south, west, north, east):
+    """returns a list of (estate_id, distance in miles from the center of
+    the box) for every geocoded estate inside the box, nearest first"""
+    center_lat, center_lon, miles = box_circle(south, west, north, east)
+    return [(estate_id, d) for estate_id, d, lat, lon in
+            _with_coordinates(estates_within(center_lat, center_lon, miles))
+            if south <= lat <= north and west <= lon <= east]
+
+def _with_coordinates(pairs):
+    coordinates = dict((row[0], row[1:]) for row in Estate.objects.filter(
+            id__in=[estate_id for estate_id, d in pairs]).values_list(
+                'id', 'latitude', 'longitude'))
+    for estate_id, d in pairs:
+        lat, lon = coordinates[estate_id]
+        yield estate_id, d, lat, lon
+
+class Gazetteer(object):
+    """Address and zip code centroid coordinates loaded from csv files"""
+    def __init__(self):
+        self.addresses = {}
+        self.zip_centroids = {}
+
+    def load(self, path):
+        """adds every row of a gazetteer csv file, returns the number of rows"""
+        count = 0
+        with open(path) as f:
+            for row in csv.DictReader(f):
+                point = (float(row['latitude']), float(row['longitude']))
+                if row.get('address'):
+                    self.addresses[normalize_address(row['address'],
+                        row.get('city', ''), row.get('zip_code', ''))] = point
+                else:
+                    self.zip_centroids[zip5(row['zip_code'])] = point
+                count += 1
+        return count
+
+    def locate(self, address_key):
+        """returns (latitude, longitude, precision) or None"""
+        if address_key in self.addresses:
+            return self.addresses[address_key] + (GeocodeCache.ADDRESS,)
+        zip_code = address_key.rsplit('|', 1)[-1]
+        if zip_code in self.zip_centroids:
+            return self.zip_centroids[zip_code] + (GeocodeCache.ZIP_CENTROID,)
+        return None
+
+def geocode_estates(gazetteer, estates=None):
+    """fills in coordinates and geohash for estates (defaults to every estate
+    without coordinates), returns a tuple (geocoded, not found)"""
+    if estates is None:
+        estates = Estate.objects.filter(latitude__isnull=True)
+    geocoded = missing = 0
+    batch = []
+    for estate in estates.only('id', 'address', 'city', 'zip_code').iterator():
+        batch.append(estate)
+        if len(batch) >= BATCH_SIZE:
+            done = _geocode_batch(gazetteer, batch)
+            geocoded, missing = geocoded + done, missing + len(batch) - done
+            batch = []
+    done = _geocode_batch(gazetteer, batch)
+    return geocoded + done, missing + len(batch) - done
+
+@transaction.commit_on_success
+def _geocode_batch(gazetteer, estates):
+    keys = dict((estate.id, normalize_address(estate.address, estate.city,
+        estate.zip_code)) for estate in estates)
+    cached = dict((row.address_key, (row.latitude, row.longitude)) for row in
+            GeocodeCache.objects.filter(address_key__in=set(keys.values())))
+    new_cache = []
+    for key in set(keys.values()) - set(cached):
+        found = gazetteer.locate(key)
+        if found is not None:
+            cached[key] = found[:2]
+            new_cache.append(GeocodeCache(address_key=key, latitude=found[0],
+                longitude=found[1], precision=found[2]))
+    GeocodeCache.objects.bulk_create(new_cache)
+    found = [(estate_id,) + tuple(cached[key]) for estate_id, key in
+            keys.items() if key in cached]
+    _update_coordinates(found)
+    return len(found)
+
+UPDATE_SQL = """
+UPDATE {table} SET latitude = found.latitude, longitude = found.longitude,
+    geohash = found.geohash
+FROM (VALUES {rows}) AS found (id, latitude, longitude, geohash)
+WHERE {table}.id = found.id"""
+
+def _update_coordinates(found):
+    """saves (estate id, latitude, longitude) for many estates: in one
+    statement on PostgreSQL, elsewhere one per distinct point (estates
+    located by zip code centroid share theirs)"""
+    if not found:
+        return
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute(UPDATE_SQL.format(table=Estate._meta.db_table,
+            rows=', '.join(['(%s, %s, %s, %s)'] * len(found))),
+            [value for estate_id, lat, lon in found
+                for value in (estate_id, lat, lon, geohash(lat, lon))])
+        return
+    points = {}
+    for estate_id, lat, lon in found:
+        points.setdefault((lat, lon), []).append(estate_id)
+    for (lat, lon), ids in points.items():
+        Estate.objects.filter(id__in=ids).update(latitude=lat, longitude=lon,
+                geohash=geohash(lat, lon))
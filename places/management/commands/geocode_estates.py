@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from places.geocoding import Gazetteer, geocode_estates
+
+class Command(BaseCommand):
+    args = '<gazetteer.csv gazetteer.csv ...>'
+    help = 'Fills in coordinates for estates from local address or zip code \
+            centroid csv files. Address files are tried before zip centroids.'
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Give at least one gazetteer csv file')
+        gazetteer = Gazetteer()
+        for path in args:
+            self.stdout.write('{}: {} rows'.format(path, gazetteer.load(path)))
+        geocoded, missing = geocode_estates(gazetteer)
+        self.stdout.write('Geocoded {} estates, {} not found'.format(
+            geocoded, missing))
@@ -4,6 +4,8 @@ from django import forms
 from django_localflavor_us.forms import USPhoneNumberField, USPSSelect, USSocialSecurityNumberField, USZipCodeField
 from django_localflavor_us.models import PhoneNumberField, USPostalCodeField # two-letter postal codes: state/territory/country
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class Estate(models.Model):
     """ An estate is just the land. Each estate can only have one address """
@@ -13,6 +15,10 @@ class Estate(models.Model):
     city = models.CharField(max_length=32)
     state = USPostalCodeField
     zip_code = models.CharField(max_length=10)
+    latitude = models.FloatField(blank=True, null=True, default=None)
+    longitude = models.FloatField(blank=True, null=True, default=None)
+    geohash = models.CharField(help_text='Filled in by places.geocoding', 
+            max_length=12, blank=True, db_index=True)
 
 class Building(models.Model):
     estate = models.ForeignKey(Estate)
@@ -34,9 +40,48 @@ class Building(models.Model):
     foundation = models.CharField(max_length=16, blank=True)
     elevator = models.CharField(max_length=16, blank=True)
 
+    def name(self, ondate=None):
+        """returns the name of this building ondate (defaults to today),
+        or None if it hadn't been named. Use places.names for many buildings"""
+        from places import names
+        if ondate is None:
+            return names.current_names([self.pk])[self.pk]
+        return names.names_on([self.pk], ondate)[self.pk]
+
 class BuildingName(models.Model):
     building = models.ForeignKey(Building)
     date = models.DateField('date of name-assignment',
             help_text='Enter the date this name was assigned if known',
             blank=True, null=True, default=None)
     name = models.CharField('building name', max_length=64)
+
+class GeocodeCache(models.Model):
+    """Coordinates found for a normalized address, so the same address is
+    only ever looked up in the gazetteer once. See places.geocoding"""
+    address_key = models.CharField(max_length=128, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    ADDRESS = 'A'
+    ZIP_CENTROID = 'Z'
+    PRECISION_CHOICES = (
+            (ADDRESS, 'Address'),
+            (ZIP_CENTROID, 'Zip code centroid'),
+    )
+    precision = models.CharField(max_length=1, choices=PRECISION_CHOICES,
+            default=ADDRESS)
+
+@receiver(post_save, sender=Building)
+def building_saved(sender, instance, **kwargs):
+    from places import facets
+    facets.index.update(instance)
+
+@receiver(post_delete, sender=Building)
+def building_deleted(sender, instance, **kwargs):
+    from places import facets
+    facets.index.remove(instance.pk)
+
+@receiver(post_save, sender=BuildingName)
+@receiver(post_delete, sender=BuildingName)
+def building_name_changed(sender, instance, **kwargs):
+    from places import names
+    names.invalidate(instance.building_id)
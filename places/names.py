@@ -0,0 +1,82 @@
+"""Building names in effect on a date, for many buildings at once.
+
+names_on() resolves any number of buildings with a single query. Current
+names rarely change, so current_names() also keeps them in a per-process
+cache. The BuildingName receivers in places.models clear entries on writes
+in this process; writes in other processes show up once the entries are
+MAX_AGE_SECONDS old."""
+import datetime
+import threading
+import time
+from django.db.models import Q
+from places.models import BuildingName
+
+MAX_AGE_SECONDS = 300
+
+_lock = threading.Lock()
+_current = {} # building id -> (expires, current name or None if not named yet)
+_cached_on = [None] # the day _current was filled, a name may take effect at midnight
+_generation = [0] # bumped by invalidate(), so a lookup racing it isn't cached
+
+def _building_ids(buildings):
+    return set(getattr(building, 'pk', building) for building in buildings)
+
+def latest_names(rows):
+    """rows are (building id, date or None, name id, name). Returns a
+    dictionary mapping building id to the name with the latest date, names
+    without a date being the oldest and the higher id winning a tie."""
+    latest = {}
+    for building_id, date, name_id, name in rows:
+        key = (date or datetime.date.min, name_id)
+        if building_id not in latest or key > latest[building_id][0]:
+            latest[building_id] = (key, name)
+    return dict((building_id, name) for building_id, (key, name)
+            in latest.items())
+
+def names_on(buildings, ondate=None):
+    """returns a dictionary mapping building id to the name in effect ondate
+    (defaults to today) for each of buildings (instances or ids), or None if
+    the building had not been named yet. Names without a date are taken
+    to be the oldest."""
+    ondate = ondate or datetime.date.today()
+    ids = _building_ids(buildings)
+    names = dict((building_id, None) for building_id in ids)
+    if not ids:
+        return names
+    names.update(latest_names(BuildingName.objects.filter(Q(date__lte=ondate) |
+            Q(date__isnull=True), building__in=ids).values_list(
+                    'building', 'date', 'id', 'name')))
+    return names
+
+def current_names(buildings):
+    """returns names_on(buildings) for today, served from the cache"""
+    today = datetime.date.today()
+    ids = _building_ids(buildings)
+    with _lock:
+        if _cached_on[0] != today:
+            _current.clear()
+            _cached_on[0] = today
+        now = time.time()
+        names = dict((building_id, _current[building_id][1])
+                for building_id in ids if building_id in _current and
+                _current[building_id][0] > now)
+        generation = _generation[0]
+    missing = ids - set(names)
+    if missing:
+        found = names_on(missing, today)
+        names.update(found)
+        with _lock:
+            if _cached_on[0] == today and _generation[0] == generation:
+                expires = time.time() + MAX_AGE_SECONDS
+                _current.update((building_id, (expires, name))
+                        for building_id, name in found.items())
+    return names
+
+def invalidate(building_id=None):
+    """forgets the cached current name of one building, or of all of them"""
+    with _lock:
+        _generation[0] += 1
+        if building_id is None:
+            _current.clear()
+        else:
+            _current.pop(building_id, None)
@@ -14,3 +14,69 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class GeocodingTest(TestCase):
+    def test_geohash(self):
+        from places.geocoding import geohash
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_normalize_address(self):
+        from places.geocoding import normalize_address
+        self.assertEqual(normalize_address('123 North Main Street.',
+            'St. Louis', '63101-1234'), '123 N MAIN ST|ST LOUIS|63101')
+
+    def test_covering_cells_contain_center(self):
+        from places.geocoding import covering_cells, geohash
+        cells = covering_cells(38.627, -90.199, 2)
+        self.assertEqual(len(cells), 9)
+        self.assertTrue(any(geohash(38.627, -90.199).startswith(cell)
+            for cell in cells))
+
+    def test_box_circle_reaches_every_corner(self):
+        from places.geocoding import box_circle, distance
+        lat, lon, miles = box_circle(30, -10, 50, 10)
+        for corner in ((30, -10), (30, 10), (50, -10), (50, 10)):
+            self.assertTrue(distance(lat, lon, *corner) <= miles)
+
+class FacetIndexTest(TestCase):
+    def test_counts_ignore_own_filter(self):
+        from places.facets import FacetIndex, bitmap_ids
+        index = FacetIndex(facets=('bedrooms', 'pool'))
+        index.load([(1, 2, 'yes'), (2, 3, ''), (3, 2, ''), (4, 3, 'yes')])
+        matched, counts = index.search({'bedrooms': 2})
+        self.assertEqual(list(bitmap_ids(matched)), [1, 3])
+        self.assertEqual(counts['bedrooms'], {2: 2, 3: 2})
+        self.assertEqual(counts['pool'], {'yes': 1, '': 1})
+        index.remove(1)
+        self.assertEqual(index.search({'pool': 'yes'})[1]['bedrooms'], {3: 1})
+        index._add(1000, (2, 'yes'))
+        self.assertEqual(index.search_ids({'bedrooms': 2})[0], [3, 1000])
+
+class BuildingNamesTest(TestCase):
+    def test_latest_names(self):
+        from datetime import date
+        from places.names import latest_names
+        rows = [(1, None, 5, 'Undated'), (1, date(2001, 1, 1), 3, 'Old'),
+                (1, date(2005, 1, 1), 4, 'New'), (1, date(2005, 1, 1), 2, 'Tie'),
+                (2, None, 7, 'Only'), (2, None, 6, 'Older')]
+        self.assertEqual(latest_names(rows), {1: 'New', 2: 'Only'})
+
+    def test_invalidate_during_lookup_is_not_cached(self):
+        from places import names
+        looked_up = []
+        def names_on(ids, ondate=None):
+            looked_up.append(set(ids))
+            if len(looked_up) == 1:
+                names.invalidate(1) # a write lands while the query runs
+            return dict((building_id, 'Name') for building_id in ids)
+        real_names_on, names.names_on = names.names_on, names_on
+        try:
+            names.invalidate()
+            self.assertEqual(names.current_names([1]), {1: 'Name'})
+            names.current_names([1])
+            self.assertEqual(len(looked_up), 2)
+            names.current_names([1])
+            self.assertEqual(len(looked_up), 2)
+        finally:
+            names.names_on = real_names_on
+            names.invalidate()